@@ -0,0 +1,247 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# --- Contrôle d'admission des exécutions SSH (API, interface web, tâches planifiées) ---
+# Une exécution attend son tour tant que son hôte ou le processus a atteint sa limite de sessions.
+# La file est équitable : à priorité égale, l'origine (manuelle / automatique) puis l'hôte servis le
+# moins récemment passent en premier. Au-delà de la taille de file, les demandes manuelles sont refusées
+# (429) ; les occurrences de tâches planifiées, déjà réclamées, attendent toujours leur tour.
+# Les limites s'appliquent par processus (application web, chaque `python worker.py`).
+ADMISSION_MAX_PAR_HOTE = int(os.environ.get("COLLECTEUR_ADMISSION_MAX_PAR_HOTE",
+                                            os.environ.get("COLLECTEUR_SSH_MAX_PAR_HOTE", "4")))
+ADMISSION_MAX_GLOBAL = int(os.environ.get("COLLECTEUR_ADMISSION_MAX_GLOBAL", "64"))
+ADMISSION_FILE_MAX = int(os.environ.get("COLLECTEUR_ADMISSION_FILE_MAX", "1000"))
+ADMISSION_FILE_MAX_PAR_HOTE = int(os.environ.get("COLLECTEUR_ADMISSION_FILE_MAX_PAR_HOTE", "50"))
+ADMISSION_REESSAI = int(os.environ.get("COLLECTEUR_ADMISSION_REESSAI", "5"))  # secondes, en-tête Retry-After
+
+PRIORITES = {"haute": 0, "normale": 1, "basse": 2}
+PRIORITE_DEFAUT = "normale"
+
+
+class AdmissionRefuseeError(Exception):
+    """File d'attente pleine (globale ou pour l'hôte) : la demande n'est pas acceptée."""
+
+
+class Ticket:
+    __slots__ = ("serveur_id", "nom", "origine", "priorite", "sequence", "depuis", "admis", "debut",
+                 "_evenement", "_rappel")
+
+    def __init__(self, serveur, origine, priorite, sequence):
+        self.serveur_id = serveur.id
+        self.nom = serveur.nom
+        self.origine = origine
+        self.priorite = priorite if priorite in PRIORITES else PRIORITE_DEFAUT
+        self.sequence = sequence
+        self.depuis = time.monotonic()
+        self.admis = False
+        self.debut = None
+        self._evenement = threading.Event()
+        self._rappel = None
+
+    def attente(self):
+        """Secondes passées en file (jusqu'à l'admission si elle a eu lieu)."""
+        return (self.debut if self.debut is not None else time.monotonic()) - self.depuis
+
+
+class ControleurAdmission:
+    def __init__(self, max_par_hote=ADMISSION_MAX_PAR_HOTE, max_global=ADMISSION_MAX_GLOBAL,
+                 file_max=ADMISSION_FILE_MAX, file_max_par_hote=ADMISSION_FILE_MAX_PAR_HOTE):
+        self.max_par_hote = max_par_hote
+        self.max_global = max_global
+        self.file_max = file_max
+        self.file_max_par_hote = file_max_par_hote
+        self._lock = threading.Lock()
+        self._file = []
+        self._en_cours = 0
+        self._en_cours_hote = {}
+        self._en_attente_hote = {}
+        self._noms = {}  # serveurs en cours ou en attente
+        # Rang du dernier service de chaque origine et de chaque (origine, hôte) : tourniquet
+        self._tours = {}
+        self._compteur = itertools.count(1)
+        self._stats = {"admis": 0, "refuses": 0}
+
+    def _cle(self, ticket):
+        return (PRIORITES[ticket.priorite], self._tours.get(ticket.origine, 0),
+                self._tours.get((ticket.origine, ticket.serveur_id), 0), ticket.sequence)
+
+    def demander(self, serveurs, origine="manuelle", priorite=PRIORITE_DEFAUT, rejeter=True):
+        """Un ticket par serveur, tous acceptés ou aucun ; admis aussitôt si les limites le permettent.
+
+        Avec `rejeter`, lève AdmissionRefuseeError si la file (globale ou d'un hôte) déborderait.
+        """
+        tickets = [Ticket(s, origine, priorite, next(self._compteur)) for s in serveurs]
+        with self._lock:
+            if rejeter:
+                self._verifier_place(tickets)
+            for t in tickets:
+                self._file.append(t)
+                self._noms[t.serveur_id] = t.nom
+                self._en_attente_hote[t.serveur_id] = self._en_attente_hote.get(t.serveur_id, 0) + 1
+            admis = self._distribuer()
+        self._notifier(admis)
+        return tickets
+
+    def _verifier_place(self, tickets):
+        """Lève AdmissionRefuseeError si les tickets qui ne peuvent pas démarrer feraient déborder la file.
+
+        Après chaque distribution, tout ticket en file est bloqué par une limite : une place libre
+        sur un hôte n'est donc disponible que s'il n'a personne en attente.
+        """
+        par_hote, noms = {}, {}
+        for t in tickets:
+            par_hote[t.serveur_id] = par_hote.get(t.serveur_id, 0) + 1
+            noms[t.serveur_id] = t.nom
+        immediats = 0
+        for serveur_id, nb in par_hote.items():
+            libres = self.max_par_hote - self._en_cours_hote.get(serveur_id, 0)
+            en_file = self._en_attente_hote.get(serveur_id, 0)
+            if en_file + max(0, nb - libres) > self.file_max_par_hote:
+                self._refuser(tickets, f"File d'attente pleine pour le serveur {noms[serveur_id]} "
+                                       f"({en_file} exécutions en attente)")
+            immediats += min(nb, libres) if not en_file else 0
+        immediats = min(immediats, max(0, self.max_global - self._en_cours))
+        if len(self._file) + len(tickets) - immediats > self.file_max:
+            self._refuser(tickets, f"Capacité d'exécution atteinte ({self._en_cours} en cours, {len(self._file)} en attente)")
+
+    def _refuser(self, tickets, message):
+        self._stats["refuses"] += len(tickets)
+        metrics.admission_refus.inc(len(tickets))
+        raise AdmissionRefuseeError(message)
+
+    def _distribuer(self):
+        """Admet les tickets en attente tant que les limites le permettent (verrou tenu)."""
+        admis = []
+        while self._file and self._en_cours < self.max_global:
+            eligibles = [t for t in self._file if self._en_cours_hote.get(t.serveur_id, 0) < self.max_par_hote]
+            if not eligibles:
+                break
+            ticket = min(eligibles, key=self._cle)
+            self._file.remove(ticket)
+            self._en_attente_hote[ticket.serveur_id] -= 1
+            if not self._en_attente_hote[ticket.serveur_id]:
+                del self._en_attente_hote[ticket.serveur_id]
+            self._en_cours += 1
+            self._en_cours_hote[ticket.serveur_id] = self._en_cours_hote.get(ticket.serveur_id, 0) + 1
+            rang = next(self._compteur)
+            self._tours[ticket.origine] = rang
+            self._tours[(ticket.origine, ticket.serveur_id)] = rang
+            ticket.admis = True
+            ticket.debut = time.monotonic()
+            self._stats["admis"] += 1
+            admis.append(ticket)
+        return admis
+
+    @staticmethod
+    def _notifier(admis):
+        for ticket in admis:
+            metrics.admission_attente.observer(ticket.attente(), origine=ticket.origine)
+            ticket._evenement.set()
+            if ticket._rappel is not None:
+                ticket._rappel()
+
+    def liberer(self, ticket):
+        """Rend la place d'un ticket admis, ou le retire de la file s'il attendait encore."""
+        with self._lock:
+            if ticket.admis:
+                ticket.admis = False
+                self._en_cours -= 1
+                self._en_cours_hote[ticket.serveur_id] -= 1
+                if not self._en_cours_hote[ticket.serveur_id]:
+                    del self._en_cours_hote[ticket.serveur_id]
+            elif ticket in self._file:
+                self._file.remove(ticket)
+                self._en_attente_hote[ticket.serveur_id] -= 1
+                if not self._en_attente_hote[ticket.serveur_id]:
+                    del self._en_attente_hote[ticket.serveur_id]
+            if ticket.serveur_id not in self._en_cours_hote and ticket.serveur_id not in self._en_attente_hote:
+                self._noms.pop(ticket.serveur_id, None)
+            admis = self._distribuer()
+        self._notifier(admis)
+
+    async def attendre(self, ticket, delai=None):
+        """Attend l'admission de `ticket` sans bloquer la boucle ; False si `delai` expire avant."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def reveiller():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with self._lock:
+            if ticket.admis:
+                return True
+            ticket._rappel = reveiller
+        try:
+            await asyncio.wait_for(asyncio.shield(future), delai)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            ticket._rappel = None
+
+    @contextmanager
+    def admettre(self, serveur, origine="automatique", priorite=PRIORITE_DEFAUT):
+        """Version bloquante (threads du planificateur) : attend son tour sans jamais être refusée."""
+        ticket, = self.demander([serveur], origine, priorite, rejeter=False)
+        try:
+            ticket._evenement.wait()
+            yield ticket
+        finally:
+            self.liberer(ticket)
+
+    def position(self, ticket):
+        """Rang de `ticket` dans la file (1 = le prochain servi à hôte libre), 0 s'il est admis."""
+        with self._lock:
+            if ticket.admis or ticket not in self._file:
+                return 0
+            cle = self._cle(ticket)
+            return 1 + sum(1 for t in self._file if self._cle(t) < cle)
+
+    def peut_accepter(self, serveur):
+        """Estimation sans réservation : reste-t-il de la place en file pour une exécution sur `serveur` ?"""
+        with self._lock:
+            return len(self._file) < self.file_max and \
+                self._en_attente_hote.get(serveur.id, 0) < self.file_max_par_hote
+
+    def etat(self, limite=100):
+        """File d'attente ordonnée (au plus `limite` entrées) et occupation par hôte."""
+        with self._lock:
+            file = sorted(self._file, key=self._cle)
+            hotes = set(self._en_cours_hote) | set(self._en_attente_hote)
+            return {
+                "max_global": self.max_global,
+                "max_par_hote": self.max_par_hote,
+                "en_cours": self._en_cours,
+                "en_attente": len(file),
+                "hotes": [{"serveur_id": h, "nom": self._noms.get(h), "en_cours": self._en_cours_hote.get(h, 0),
+                           "en_attente": self._en_attente_hote.get(h, 0)} for h in sorted(hotes)],
+                "file": [{"position": i, "serveur_id": t.serveur_id, "nom": t.nom,
+                          "origine": t.origine, "priorite": t.priorite, "attente_s": round(t.attente(), 1)}
+                         for i, t in enumerate(file[:limite], start=1)],
+            }
+
+    def lot_max(self):
+        """Plus grand lot de serveurs distincts que demander() accepte quand rien d'autre n'attend.
+
+        Au-delà, la demande serait refusée quel que soit l'état : l'appelant doit la fractionner.
+        """
+        return self.max_global + self.file_max
+
+    def statistiques(self):
+        with self._lock:
+            return dict(self._stats, en_cours=self._en_cours, en_attente=len(self._file),
+                        max_global=self.max_global, max_par_hote=self.max_par_hote, file_max=self.file_max)
+
+
+admission = ControleurAdmission()
+
+metrics.Jauge("collecteur_admission_en_cours", "Exécutions SSH admises en cours",
+              fonction=lambda: admission._en_cours)
+metrics.Jauge("collecteur_admission_en_attente", "Exécutions SSH en file d'attente d'admission",
+              fonction=lambda: len(admission._file))
@@ -0,0 +1,289 @@
+"""Suite de benchmarks de Le Collecteur.
+
+Lance l'application en mémoire (httpx + ASGI, sans uvicorn) dans un dossier temporaire,
+avec des serveurs SSH simulés (bench/serveur_ssh.py) comme cibles, et mesure :
+
+- execution    : POST /serveurs/{id}/executer_script
+- planificateur: retard de déclenchement des tâches planifiées
+- logs_html    : rendu de /logs_html sur une table LogExecution volumineuse
+- logs_api     : GET /serveurs/{id}/logs (pagination profonde)
+- dashboard    : GET /dashboard_html
+
+Usage :
+    python -m bench.run_bench --sortie resultats.json
+    python -m bench.run_bench --hotes 50 --requetes 2000 --latence 0.05 --logs 1000000
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentile(valeurs, p):
+    if not valeurs:
+        return None
+    valeurs = sorted(valeurs)
+    rang = min(len(valeurs) - 1, max(0, round(p / 100 * (len(valeurs) - 1))))
+    return valeurs[rang]
+
+
+def _resume(durees, duree_totale, erreurs=0):
+    """Statistiques d'une série de mesures (durées en secondes)."""
+    return {
+        "n": len(durees),
+        "erreurs": erreurs,
+        "duree_totale_s": round(duree_totale, 3),
+        "debit_par_s": round(len(durees) / duree_totale, 2) if duree_totale else None,
+        "p50_ms": round(_percentile(durees, 50) * 1000, 2) if durees else None,
+        "p90_ms": round(_percentile(durees, 90) * 1000, 2) if durees else None,
+        "p99_ms": round(_percentile(durees, 99) * 1000, 2) if durees else None,
+        "max_ms": round(max(durees) * 1000, 2) if durees else None,
+    }
+
+
+async def _charge(client, nb, concurrence, requete):
+    """Envoie `nb` requêtes avec au plus `concurrence` en vol ; `requete(client, i)` → réponse."""
+    semaphore = asyncio.Semaphore(concurrence)
+    durees = []
+    erreurs = 0
+
+    async def une(i):
+        nonlocal erreurs
+        async with semaphore:
+            debut = time.perf_counter()
+            try:
+                reponse = await requete(client, i)
+                ok = reponse.status_code < 400 and "error" not in _json_ou_vide(reponse)
+            except Exception:
+                ok = False
+            durees.append(time.perf_counter() - debut)
+            if not ok:
+                erreurs += 1
+
+    debut = time.perf_counter()
+    await asyncio.gather(*(une(i) for i in range(nb)))
+    return _resume(durees, time.perf_counter() - debut, erreurs)
+
+
+def _json_ou_vide(reponse):
+    if not reponse.headers.get("content-type", "").startswith("application/json"):
+        return {}
+    donnees = reponse.json()
+    return donnees if isinstance(donnees, dict) else {}
+
+
+def preparer_dossier():
+    """Travaille dans un dossier temporaire : base SQLite neuve, static/templates du dépôt."""
+    dossier = tempfile.mkdtemp(prefix="collecteur-bench-")
+    for nom in ("static", "templates"):
+        os.symlink(os.path.join(RACINE, nom), os.path.join(dossier, nom))
+    os.chdir(dossier)
+    if RACINE not in sys.path:
+        sys.path.insert(0, RACINE)
+    return dossier
+
+
+def creer_serveurs(SessionLocal, Serveur, ports):
+    from bench.serveur_ssh import UTILISATEUR, MOT_DE_PASSE, adresse_boucle_locale
+    db = SessionLocal()
+    try:
+        serveurs = [
+            Serveur(nom=f"bench-{i}", adresse_ip=adresse_boucle_locale(i), port_ssh=port,
+                    utilisateur_ssh=UTILISATEUR, mot_de_passe=MOT_DE_PASSE)
+            for i, port in enumerate(ports)
+        ]
+        db.add_all(serveurs)
+        db.commit()
+        return [s.id for s in serveurs]
+    finally:
+        db.close()
+
+
+def peupler_logs(engine, LogExecution, serveur_ids, nb, lot=10000):
+    """Insère `nb` logs répartis sur les serveurs, étalés sur 60 jours."""
+    maintenant = datetime.utcnow()
+    table = LogExecution.__table__
+    with engine.begin() as conn:
+        for debut in range(0, nb, lot):
+            lignes = []
+            for i in range(debut, min(nb, debut + lot)):
+                echec = i % 50 == 0
+                lignes.append({
+                    "serveur_id": serveur_ids[i % len(serveur_ids)],
+                    "date_execution": maintenant - timedelta(seconds=random.randint(0, 60 * 86400)),
+                    "script": "uptime",
+                    "stdout": None if echec else f" {i} up 12 days, load average: 0.01, 0.02, 0.00\n",
+                    "stderr": "",
+                    "error": "Erreur automatique : simulée" if echec else None,
+                    "origine": "automatique" if i % 3 == 0 else "manuelle",
+                    "echec": echec,
+                })
+            conn.execute(table.insert(), lignes)
+
+
+def bench_planificateur(planificateur, SessionLocal, TachePlanifiee, serveur_ids, nb, delai=2.0, attente_max=120):
+    """Programme `nb` tâches à la même échéance et mesure le retard de prise en charge par le worker."""
+    retards = []
+    termines = threading.Semaphore(0)
+    ids_bench = set()
+    executer_origine = planificateur.executer_tache_planifiee
+
+    def executer_mesure(tache_id, echeance):
+        if tache_id in ids_bench:
+            retards.append((datetime.utcnow() - echeance).total_seconds())
+        try:
+            executer_origine(tache_id, echeance)
+        finally:
+            if tache_id in ids_bench:
+                termines.release()
+
+    planificateur.executer_tache_planifiee = executer_mesure
+    echeance = datetime.utcnow().replace(microsecond=0) + timedelta(seconds=delai + 1)
+    db = SessionLocal()
+    try:
+        taches = [
+            TachePlanifiee(serveur_id=serveur_ids[i % len(serveur_ids)], script="uptime",
+                           date_execution=echeance, statut="active")
+            for i in range(nb)
+        ]
+        db.add_all(taches)
+        db.commit()
+        ids_bench.update(tache.id for tache in taches)
+        planificateur.synchroniser_tache(taches[0])
+    finally:
+        db.close()
+    limite = time.monotonic() + attente_max + delai + 1
+    for _ in range(nb):
+        if not termines.acquire(timeout=max(0, limite - time.monotonic())):
+            break
+    duree = (datetime.utcnow() - echeance).total_seconds()
+    planificateur.executer_tache_planifiee = executer_origine
+    resultat = _resume(retards, max(duree, 1e-6), erreurs=nb - len(retards))
+    resultat["mesure"] = "retard de prise en charge (début - échéance)"
+    return resultat
+
+
+async def executer(args):
+    from bench.serveur_ssh import demarrer_serveurs
+
+    processus, ports = demarrer_serveurs(args.hotes, args.latence, args.taille_sortie, args.taux_echec)
+    dossier = preparer_dossier()
+    debut_import = time.perf_counter()
+    import main
+    duree_import = time.perf_counter() - debut_import
+    import httpx
+    import planificateur
+    from database import SessionLocal, engine
+    from models import Serveur, LogExecution, TachePlanifiee
+
+    resultats = {"import_main": {"duree_s": round(duree_import, 3)}}
+    # ASGITransport n'émet pas les événements lifespan : démarrage et arrêt des services faits ici
+    debut_services = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        resultats["demarrage_services"] = {"duree_s": round(time.perf_counter() - debut_services, 3)}
+        serveur_ids = creer_serveurs(SessionLocal, Serveur, ports)
+        await _scenarios(main, httpx, planificateur, SessionLocal, engine, LogExecution, TachePlanifiee,
+                         serveur_ids, args, resultats)
+    processus.terminate()
+    return dossier, resultats
+
+
+async def _scenarios(main, httpx, planificateur, SessionLocal, engine, LogExecution, TachePlanifiee,
+                     serveur_ids, args, resultats):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        await client.post("/login", data={"username": main.ADMIN_USERNAME, "password": args.mot_de_passe})
+
+        if "execution" in args.scenarios:
+            async def requete_exec(c, i):
+                return await c.post(f"/serveurs/{serveur_ids[i % len(serveur_ids)]}/executer_script", json={"script": "uptime"})
+            # Échauffement : ouvre les connexions du pool SSH
+            await _charge(client, len(serveur_ids), args.concurrence, requete_exec)
+            resultats["execution"] = await _charge(client, args.requetes, args.concurrence, requete_exec)
+
+        if "planificateur" in args.scenarios:
+            resultats["planificateur"] = await asyncio.to_thread(
+                bench_planificateur, planificateur, SessionLocal, TachePlanifiee, serveur_ids, args.taches)
+
+        if {"logs_html", "logs_api", "dashboard"} & set(args.scenarios):
+            debut = time.perf_counter()
+            await asyncio.to_thread(peupler_logs, engine, LogExecution, serveur_ids, args.logs)
+            resultats["peuplement_logs"] = {"n": args.logs, "duree_s": round(time.perf_counter() - debut, 3)}
+
+        if "logs_html" in args.scenarios:
+            resultats["logs_html"] = await _charge(client, args.requetes_lecture, args.concurrence_lecture,
+                lambda c, i: c.get("/logs_html", params={"serveur_id": serveur_ids[i % len(serveur_ids)]}))
+
+        if "logs_api" in args.scenarios:
+            async def requete_pages(c, i):
+                # Parcourt 5 pages successives : mesure aussi la pagination par curseur
+                params = {"limite": 100}
+                for _ in range(5):
+                    reponse = await c.get(f"/serveurs/{serveur_ids[i % len(serveur_ids)]}/logs", params=params)
+                    curseur = reponse.json().get("curseur_suivant")
+                    if not curseur:
+                        break
+                    params["curseur"] = curseur
+                return reponse
+            resultats["logs_api"] = await _charge(client, args.requetes_lecture, args.concurrence_lecture, requete_pages)
+
+        if "dashboard" in args.scenarios:
+            resultats["dashboard"] = await _charge(client, args.requetes_lecture, args.concurrence_lecture,
+                lambda c, i: c.get("/dashboard_html"))
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RACINE, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de Le Collecteur")
+    parser.add_argument("--hotes", type=int, default=10, help="nombre de serveurs SSH simulés")
+    parser.add_argument("--latence", type=float, default=0.01, help="latence simulée par commande (s)")
+    parser.add_argument("--taille-sortie", type=int, default=1000, help="octets de stdout par commande")
+    parser.add_argument("--taux-echec", type=float, default=0.0, help="proportion de commandes en échec")
+    parser.add_argument("--requetes", type=int, default=500, help="exécutions mesurées")
+    parser.add_argument("--concurrence", type=int, default=32, help="exécutions simultanées côté client")
+    parser.add_argument("--taches", type=int, default=200, help="tâches planifiées à la même échéance")
+    parser.add_argument("--logs", type=int, default=200000, help="logs insérés avant les mesures de lecture")
+    parser.add_argument("--requetes-lecture", type=int, default=200, help="requêtes par scénario de lecture")
+    parser.add_argument("--concurrence-lecture", type=int, default=8)
+    parser.add_argument("--scenarios", nargs="+",
+                        default=["execution", "planificateur", "logs_html", "logs_api", "dashboard"])
+    parser.add_argument("--mot-de-passe", default="collecteur2024", help="mot de passe admin de l'interface")
+    parser.add_argument("--sortie", help="fichier JSON de résultats (sinon stdout)")
+    args = parser.parse_args(argv)
+
+    dossier, resultats = asyncio.run(executer(args))
+    rapport = {
+        "date": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plateforme": platform.platform(),
+        "parametres": {k: v for k, v in vars(args).items() if k not in ("sortie", "mot_de_passe")},
+        "dossier": dossier,
+        "resultats": resultats,
+    }
+    texte = json.dumps(rapport, indent=2, ensure_ascii=False)
+    if args.sortie:
+        with open(os.path.join(RACINE, args.sortie) if not os.path.isabs(args.sortie) else args.sortie, "w") as f:
+            f.write(texte + "\n")
+    print(texte)
+
+
+if __name__ == "__main__":
+    main_cli()
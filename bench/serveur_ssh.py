@@ -0,0 +1,113 @@
+"""Serveurs SSH locaux (paramiko) servant de cibles simulées pour les benchmarks.
+
+Chaque commande reçue est simulée : attente de `latence` secondes, puis envoi de
+`taille_sortie` octets sur stdout, ou échec (stderr + code retour 1) avec la probabilité
+`taux_echec`. Aucune commande n'est réellement exécutée.
+"""
+import multiprocessing
+import random
+import socket
+import threading
+import time
+
+import paramiko
+
+UTILISATEUR = "bench"
+MOT_DE_PASSE = "bench"
+_BLOC = (b"x" * 79 + b"\n") * 400  # 32 000 octets de lignes de 80 caractères
+
+
+class _Interface(paramiko.ServerInterface):
+    def __init__(self, config):
+        self.config = config
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if username == UTILISATEUR and password == MOT_DE_PASSE:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        # La réponse au exec doit partir avant les données : la simulation démarre dans un thread
+        threading.Thread(target=_simuler, args=(channel, self.config), daemon=True).start()
+        return True
+
+
+def _simuler(canal, config):
+    try:
+        time.sleep(config["latence"])
+        if random.random() < config["taux_echec"]:
+            canal.sendall_stderr(b"erreur simulee\n")
+            canal.send_exit_status(1)
+        else:
+            reste = config["taille_sortie"]
+            while reste > 0:
+                envoi = _BLOC[:reste]
+                canal.sendall(envoi)
+                reste -= len(envoi)
+            canal.send_exit_status(0)
+    except Exception:
+        pass
+    finally:
+        canal.close()
+
+
+def _servir_connexion(sock, cle, config):
+    transport = paramiko.Transport(sock)
+    transport.add_server_key(cle)
+    try:
+        transport.start_server(server=_Interface(config))
+    except (paramiko.SSHException, EOFError, OSError):
+        return
+    canaux = []  # un canal non référencé serait fermé par le ramasse-miettes
+    while transport.is_active():
+        canal = transport.accept(1)
+        if canal is not None:
+            canaux = [c for c in canaux if not c.closed] + [canal]
+
+
+def adresse_boucle_locale(i):
+    """Adresse distincte par serveur simulé (adresse_ip est unique) dans 127.0.0.0/8."""
+    return f"127.0.{i // 250}.{i % 250 + 1}"
+
+
+def demarrer_serveur(config, cle=None, adresse="127.0.0.1"):
+    """Démarre un serveur SSH simulé dans des threads, retourne son port."""
+    cle = cle or paramiko.RSAKey.generate(2048)
+    ecoute = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    ecoute.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    ecoute.bind((adresse, 0))
+    ecoute.listen(512)
+
+    def accepter():
+        while True:
+            sock, _ = ecoute.accept()
+            threading.Thread(target=_servir_connexion, args=(sock, cle, config), daemon=True).start()
+
+    threading.Thread(target=accepter, daemon=True).start()
+    return ecoute.getsockname()[1]
+
+
+def _processus_serveurs(nb, config, ports):
+    cle = paramiko.RSAKey.generate(2048)
+    for i in range(nb):
+        ports.put(demarrer_serveur(config, cle, adresse_boucle_locale(i)))
+    threading.Event().wait()
+
+
+def demarrer_serveurs(nb, latence=0.0, taille_sortie=100, taux_echec=0.0):
+    """Démarre `nb` serveurs simulés dans un processus séparé (pas de contention de GIL avec
+    l'application mesurée). Retourne (processus, ports) ; le i-ème écoute sur adresse_boucle_locale(i)."""
+    config = {"latence": latence, "taille_sortie": taille_sortie, "taux_echec": taux_echec}
+    ctx = multiprocessing.get_context("spawn")
+    ports = ctx.Queue()
+    processus = ctx.Process(target=_processus_serveurs, args=(nb, config, ports), daemon=True)
+    processus.start()
+    return processus, [ports.get(timeout=60) for _ in range(nb)]
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+
+from sqlalchemy import event
+
+import metrics
+from database import engine
+
+# --- Cache en mémoire des pages HTML et listes (inventaire, tableau de bord, tâches) ---
+# Chaque domaine de données a un numéro de version, incrémenté quand une transaction qui a écrit
+# dans l'une de ses tables se termine. Une entrée en cache n'est servie que pour la version sous
+# laquelle elle a été calculée, et au plus CACHE_TTL secondes : les écritures faites par un autre
+# processus (workers, autre instance) ne sont pas vues autrement.
+CACHE_ACTIF = os.environ.get("COLLECTEUR_CACHE", "1") != "0"
+CACHE_TTL = float(os.environ.get("COLLECTEUR_CACHE_TTL", "30"))  # secondes
+
+DOMAINES = {
+    "serveurs": "serveurs",
+    "groupes": "serveurs",
+    "serveurs_groupes": "serveurs",
+    "logs_execution": "logs",
+    "taches_planifiees": "taches",
+}
+
+_ECRITURE = re.compile(r'^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"?(\w+)', re.IGNORECASE)
+_RETOUR = re.compile(r'\bRETURNING\b', re.IGNORECASE)
+# Distingue les ETag de deux démarrages (les versions repartent de zéro)
+_INSTANCE = uuid.uuid4().hex[:8]
+
+
+class Cache:
+    def __init__(self, ttl=CACHE_TTL, actif=CACHE_ACTIF):
+        self.ttl = ttl
+        self.actif = actif
+        self._versions = {}
+        self._modifications = {}
+        self._entrees = {}
+        self._lock = threading.Lock()
+        self._demarrage = time.time()
+
+    def version(self, *domaines):
+        return tuple(self._versions.get(d, 0) for d in domaines)
+
+    def invalider(self, *domaines):
+        maintenant = time.time()
+        with self._lock:
+            for domaine in domaines:
+                self._versions[domaine] = self._versions.get(domaine, 0) + 1
+                self._modifications[domaine] = maintenant
+
+    def obtenir(self, cle, domaines, calcul):
+        """Valeur de `cle`, recalculée par `calcul()` si l'un des `domaines` a changé ou si elle a expiré."""
+        if not self.actif:
+            return calcul()
+        version = self.version(*domaines)
+        entree = self._entrees.get(cle)
+        if entree is not None and entree[0] == version and time.monotonic() < entree[1]:
+            metrics.cache_requetes.inc(resultat="hit")
+            return entree[2]
+        metrics.cache_requetes.inc(resultat="miss")
+        valeur = calcul()
+        # Calculée sous `version` : une écriture terminée entre-temps la rendra aussitôt périmée
+        self._entrees[cle] = (version, time.monotonic() + self.ttl, valeur)
+        return valeur
+
+    def derniere_modification(self, *domaines):
+        return max([self._modifications.get(d, self._demarrage) for d in domaines])
+
+    def entetes(self, *domaines):
+        """ETag et Last-Modified des données de `domaines`, tous deux bornés par la période du TTL.
+
+        Les écritures d'autres processus ne sont vues qu'à l'expiration du TTL : Last-Modified vaut
+        au moins le début de la période courante, sinon un client qui n'envoie que If-Modified-Since
+        recevrait 304 indéfiniment.
+        """
+        maintenant = time.time()
+        periode = int(maintenant // self.ttl) if self.ttl > 0 else 0
+        debut_periode = periode * self.ttl if self.ttl > 0 else maintenant
+        empreinte = hashlib.sha1(repr((_INSTANCE, periode, domaines, self.version(*domaines))).encode()).hexdigest()[:16]
+        return {
+            "ETag": f'W/"{empreinte}"',
+            "Last-Modified": formatdate(max(self.derniere_modification(*domaines), debut_periode), usegmt=True),
+            # Le navigateur garde la page mais la revalide à chaque affichage
+            "Cache-Control": "private, no-cache",
+        }
+
+    def non_modifie(self, entetes_requete, entetes):
+        """True si le client a déjà cette version (If-None-Match, sinon If-Modified-Since)."""
+        if not self.actif:
+            return False
+        si_different = entetes_requete.get("if-none-match")
+        if si_different is not None:
+            return entetes["ETag"] in [e.strip() for e in si_different.split(",")] or si_different.strip() == "*"
+        si_modifie = entetes_requete.get("if-modified-since")
+        if si_modifie is None:
+            return False
+        try:
+            return parsedate_to_datetime(entetes["Last-Modified"]) <= parsedate_to_datetime(si_modifie)
+        except (TypeError, ValueError):
+            return False
+
+    def statistiques(self):
+        return {"actif": self.actif, "ttl": self.ttl, "entrees": len(self._entrees), "versions": dict(self._versions)}
+
+
+cache = Cache()
+
+
+# --- Invalidation : tables écrites par chaque connexion, appliquées quand elle revient au pool ---
+# (après COMMIT, donc jamais avant que les nouvelles données soient lisibles ; oubliées sur ROLLBACK)
+@event.listens_for(engine, "after_cursor_execute")
+def _noter_ecriture(conn, cursor, statement, parameters, context, executemany):
+    correspondance = _ECRITURE.match(statement)
+    # Une écriture qui n'a touché aucune ligne ne change rien (le rowcount d'un RETURNING n'est connu
+    # qu'après lecture des lignes : ces requêtes-là sont toujours comptées)
+    if cursor.rowcount == 0 and not _RETOUR.search(statement):
+        return
+    if correspondance and correspondance.group(1).lower() in DOMAINES:
+        conn.info.setdefault("cache_domaines", set()).add(DOMAINES[correspondance.group(1).lower()])
+
+
+@event.listens_for(engine, "rollback")
+def _oublier_ecritures(conn):
+    conn.info.pop("cache_domaines", None)
+
+
+@event.listens_for(engine, "commit")
+def _valider_ecritures(conn):
+    conn.info["cache_valides"] = conn.info.pop("cache_domaines", set()) | conn.info.get("cache_valides", set())
+
+
+@event.listens_for(engine, "checkin")
+def _appliquer_ecritures(dbapi_connection, connection_record):
+    domaines = connection_record.info.pop("cache_valides", None)
+    connection_record.info.pop("cache_domaines", None)
+    if domaines:
+        cache.invalider(*domaines)
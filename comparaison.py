@@ -0,0 +1,106 @@
+import difflib
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, cast, func
+from sqlalchemy.orm import undefer
+
+from models import LogExecution, Serveur
+
+# --- Comparaison des résultats d'une même exécution sur plusieurs serveurs (lot) ---
+# Les logs d'un lot partagent un lot_id ; chaque log porte l'empreinte de ses sorties, calculée à
+# l'écriture. Le regroupement est un GROUP BY sur l'index (lot_id, empreinte_sortie) : seules les
+# sorties d'un représentant par groupe sont relues, pour l'affichage et les diffs.
+COMPARAISON_DIFF_LIGNES_MAX = int(os.environ.get("COLLECTEUR_COMPARAISON_DIFF_LIGNES_MAX", "300"))
+COMPARAISON_SERVEURS_MAX = int(os.environ.get("COLLECTEUR_COMPARAISON_SERVEURS_MAX", "50"))  # serveurs listés par groupe
+COMPARAISON_LOTS_JOURS = int(os.environ.get("COLLECTEUR_COMPARAISON_LOTS_JOURS", "7"))
+
+
+def nouveau_lot():
+    return uuid.uuid4().hex
+
+
+def _texte(log):
+    """Résultat d'un log sous forme de lignes comparables (stdout, puis stderr et erreur s'il y en a)."""
+    lignes = (log.stdout or "").splitlines()
+    if log.stderr:
+        lignes += ["--- stderr ---"] + log.stderr.splitlines()
+    if log.error:
+        lignes += ["--- erreur ---"] + log.error.splitlines()
+    return lignes
+
+
+def _diff(reference, autre, nom_autre):
+    diff = list(difflib.unified_diff(reference, autre, "majorité", nom_autre, lineterm="", n=2))
+    if len(diff) > COMPARAISON_DIFF_LIGNES_MAX:
+        diff = diff[:COMPARAISON_DIFF_LIGNES_MAX] + [f"[... {len(diff) - COMPARAISON_DIFF_LIGNES_MAX} lignes de diff non affichées ...]"]
+    return "\n".join(diff)
+
+
+def agreger(db, lot_id):
+    """Résultats du lot regroupés par empreinte (groupe majoritaire en premier, diffs des autres), None si inconnu."""
+    comptes = db.query(LogExecution.empreinte_sortie, func.count(LogExecution.id), func.min(LogExecution.id)) \
+        .filter(LogExecution.lot_id == lot_id) \
+        .group_by(LogExecution.empreinte_sortie).all()
+    if not comptes:
+        return None
+    comptes.sort(key=lambda c: (-c[1], c[2]))
+    representants = {log.id: log for log in db.query(LogExecution)
+                     .options(undefer(LogExecution.stdout), undefer(LogExecution.stderr))
+                     .filter(LogExecution.id.in_([c[2] for c in comptes]))}
+    membres = {}
+    for log_id, empreinte_sortie, serveur_id, nom in db.query(
+            LogExecution.id, LogExecution.empreinte_sortie, LogExecution.serveur_id, Serveur.nom) \
+            .outerjoin(Serveur, Serveur.id == LogExecution.serveur_id) \
+            .filter(LogExecution.lot_id == lot_id).order_by(Serveur.nom):
+        liste = membres.setdefault(empreinte_sortie, [])
+        if len(liste) < COMPARAISON_SERVEURS_MAX:
+            liste.append({"log_id": log_id, "serveur_id": serveur_id, "nom": nom})
+
+    total = sum(c[1] for c in comptes)
+    premier = representants[comptes[0][2]]
+    reference = _texte(premier)
+    groupes = []
+    for rang, (empreinte_sortie, nb, representant_id) in enumerate(comptes):
+        log = representants[representant_id]
+        groupes.append({
+            "empreinte": empreinte_sortie,
+            "nb": nb,
+            "part": round(nb / total, 4),
+            "majoritaire": rang == 0,
+            "echec": log.echec,
+            "log_id": log.id,
+            "stdout": log.stdout,
+            "stderr": log.stderr,
+            "error": log.error,
+            "serveurs": membres.get(empreinte_sortie, []),
+            "diff": None if rang == 0 else _diff(reference, _texte(log), f"groupe {rang + 1}"),
+        })
+    return {
+        "lot_id": lot_id,
+        "script": premier.script,
+        "date_execution": premier.date_execution.isoformat(),
+        "origine": premier.origine,
+        "total": total,
+        "nb_groupes": len(groupes),
+        "groupes": groupes,
+    }
+
+
+def lots_recents(db, limite=50, jours=COMPARAISON_LOTS_JOURS):
+    """Derniers lots (exécutions multi-serveurs) des `jours` derniers jours, avec le nombre de résultats distincts."""
+    depuis = datetime.utcnow() - timedelta(days=jours)
+    lignes = db.query(
+        LogExecution.lot_id,
+        func.min(LogExecution.script),
+        func.max(LogExecution.date_execution),
+        func.count(LogExecution.id),
+        func.count(func.distinct(LogExecution.empreinte_sortie)),
+        func.sum(cast(LogExecution.echec, Integer)),
+    ).filter(LogExecution.date_execution >= depuis, LogExecution.lot_id.isnot(None)) \
+        .group_by(LogExecution.lot_id) \
+        .order_by(func.max(LogExecution.date_execution).desc()).limit(limite).all()
+    return [{"lot_id": lot_id, "script": script, "date_execution": date.isoformat(), "total": total,
+             "nb_groupes": nb_groupes, "echecs": int(echecs or 0)}
+            for lot_id, script, date, total, nb_groupes, echecs in lignes]
@@ -0,0 +1,175 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy import bindparam
+
+import metrics
+from database import SessionLocal
+from models import TachePlanifiee
+
+# --- Écriture différée des logs d'exécution ---
+# Les résultats sont mis en file et écrits par un thread unique, en transactions groupées
+# (au plus ECRIVAIN_LOT_MAX éléments ou ECRIVAIN_DELAI secondes d'attente).
+ECRIVAIN_LOT_MAX = int(os.environ.get("COLLECTEUR_ECRIVAIN_LOT_MAX", "500"))
+ECRIVAIN_DELAI = float(os.environ.get("COLLECTEUR_ECRIVAIN_DELAI", "0.2"))
+ECRIVAIN_FILE_MAX = int(os.environ.get("COLLECTEUR_ECRIVAIN_FILE_MAX", "10000"))  # au-delà, ajouter() attend
+
+logger = logging.getLogger("collecteur.ecrivain_logs")
+
+_ARRET = object()
+
+
+class _Element:
+    __slots__ = ("log", "tache", "future")
+
+    def __init__(self, log, tache, future):
+        self.log = log
+        self.tache = tache
+        self.future = future
+
+
+class EcrivainLogs:
+    def __init__(self, lot_max=ECRIVAIN_LOT_MAX, delai=ECRIVAIN_DELAI, file_max=ECRIVAIN_FILE_MAX):
+        self.lot_max = lot_max
+        self.delai = delai
+        self._file = queue.Queue(maxsize=file_max)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._arrete = False
+        self._stats = {"elements": 0, "lots": 0, "echecs": 0}
+
+    def _mettre_en_file(self, element):
+        with self._lock:
+            if not self._arrete:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._boucle, name="ecrivain-logs", daemon=True)
+                    self._thread.start()
+                    atexit.unregister(self.arreter)
+                    atexit.register(self.arreter)
+                self._file.put(element)
+                return
+        # Après l'arrêt (fin de processus), écriture directe : aucun résultat n'est perdu
+        self._ecrire_lot([element])
+
+    def ajouter(self, log=None, tache=None):
+        """Met en file un LogExecution (non attaché à une session) et/ou une mise à jour de tâche.
+
+        `tache` : dict de colonnes de TachePlanifiee, avec "id", écrit dans la même transaction que le log.
+        """
+        self._mettre_en_file(_Element(log, tache, None))
+
+    def ajouter_logs(self, logs):
+        for log in logs:
+            self._mettre_en_file(_Element(log, None, None))
+
+    def ecrire(self, log):
+        """Chemin synchrone : écrit `log` dans le prochain lot, sans attendre le délai, et retourne son id."""
+        future = Future()
+        self._mettre_en_file(_Element(log, None, future))
+        return future.result()
+
+    def _boucle(self):
+        while True:
+            element = self._file.get()
+            if element is _ARRET:
+                return
+            lot = [element]
+            arret = False
+            presse = element.future is not None
+            limite = time.monotonic() + self.delai
+            while len(lot) < self.lot_max:
+                try:
+                    # Un appelant synchrone attend : on ne prend que ce qui est déjà en file
+                    if presse:
+                        element = self._file.get_nowait()
+                    else:
+                        element = self._file.get(timeout=max(0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+                if element is _ARRET:
+                    arret = True
+                    break
+                lot.append(element)
+                presse = presse or element.future is not None
+            self._ecrire_lot(lot)
+            if arret:
+                return
+
+    def _ecrire_lot(self, lot):
+        try:
+            self._transaction(lot)
+        except Exception:
+            if len(lot) == 1:
+                self._stats["echecs"] += 1
+                logger.exception("Écriture d'un log d'exécution impossible")
+                if lot[0].future is not None:
+                    lot[0].future.set_exception(RuntimeError("Écriture du log impossible"))
+                return
+            # Un élément invalide ne doit pas faire perdre le reste du lot
+            for element in lot:
+                self._ecrire_lot([element])
+            return
+        self._stats["lots"] += 1
+        self._stats["elements"] += len(lot)
+        metrics.ecrivain_lot.observer(len(lot))
+        for element in lot:
+            if element.future is not None:
+                element.future.set_result(element.log.id if element.log is not None else None)
+
+    def _transaction(self, lot):
+        # Les objets restent lisibles après l'écriture (id, erreur) par le code qui les a créés
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            logs = [e.log for e in lot if e.log is not None]
+            taches = [e.tache for e in lot if e.tache is not None]
+            db.add_all(logs)
+            if taches:
+                # Tâche supprimée pendant son exécution : aucune ligne mise à jour, le log est gardé
+                table = TachePlanifiee.__table__
+                db.execute(table.update().where(table.c.id == bindparam("tache_id")),
+                           [dict({k: v for k, v in t.items() if k != "id"}, tache_id=t["id"]) for t in taches])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def vider(self):
+        """Attend l'écriture de tout ce qui a été mis en file avant l'appel."""
+        future = Future()
+        self._mettre_en_file(_Element(None, None, future))
+        future.result()
+
+    def demarrer(self):
+        """Rouvre la file après un arrêt (nouveau cycle de vie de l'application) ; le thread part au premier ajout."""
+        with self._lock:
+            self._arrete = False
+
+    def arreter(self):
+        """Écrit tout ce qui reste en file puis arrête le thread (appelé à l'arrêt de l'application)."""
+        with self._lock:
+            if self._arrete:
+                return
+            self._arrete = True
+            thread = self._thread
+        # Plus rien n'entre dans la file après la sentinelle : le thread écrit le reste et s'arrête
+        if thread is not None:
+            self._file.put(_ARRET)
+            thread.join()
+        with self._lock:
+            self._thread = None
+
+    def statistiques(self):
+        return dict(self._stats, en_file=self._file.qsize())
+
+
+ecrivain_logs = EcrivainLogs()
+
+metrics.Jauge("collecteur_ecrivain_logs_en_file", "Logs d'exécution en attente d'écriture",
+              fonction=lambda: ecrivain_logs._file.qsize())
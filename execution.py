@@ -0,0 +1,207 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from admission import admission
+from ssh_pool import pool_ssh, Annulation
+
+# --- Moteur d'exécution asynchrone ---
+# Paramiko est bloquant : chaque commande tourne dans un pool de threads dédié et borné,
+# les handlers HTTP l'attendent sans occuper de worker. Chaque commande attend d'abord son tour
+# auprès du contrôleur d'admission (admission.py), sans occuper de thread. Au-delà de la capacité
+# (concurrence + file d'attente, ou file d'admission pleine), les nouvelles demandes sont refusées.
+EXECUTION_CONCURRENCE_MAX = int(os.environ.get("COLLECTEUR_EXECUTION_CONCURRENCE_MAX", "32"))
+EXECUTION_FILE_MAX = int(os.environ.get("COLLECTEUR_EXECUTION_FILE_MAX", "1000"))
+EXECUTION_TIMEOUT = float(os.environ.get("COLLECTEUR_EXECUTION_TIMEOUT", "300"))
+# Serveurs d'une exécution multi-serveurs en vol à la fois ; les suivants prennent les places libérées
+EXECUTION_FENETRE_MULTI = int(os.environ.get("COLLECTEUR_EXECUTION_FENETRE_MULTI", "256"))
+EXECUTION_RAFRAICHISSEMENT_FILE = 1  # secondes entre deux positions en file envoyées en direct
+
+_FIN = object()
+
+
+class SurchargeError(Exception):
+    """Le moteur d'exécution a atteint sa capacité (exécutions en cours + en attente)."""
+
+
+class MoteurExecution:
+    def __init__(self, concurrence=EXECUTION_CONCURRENCE_MAX, file_max=EXECUTION_FILE_MAX):
+        self.concurrence = concurrence
+        self.capacite = concurrence + file_max
+        self._executeur = ThreadPoolExecutor(max_workers=concurrence, thread_name_prefix="execution")
+        self._en_vol = 0  # modifié uniquement depuis la boucle asyncio
+        self._en_cours = 0
+        self._lock = threading.Lock()
+
+    def _reserver(self, nb):
+        if self._en_vol + nb > self.capacite:
+            raise SurchargeError(f"Capacité d'exécution atteinte ({self._en_vol} en cours ou en attente)")
+        self._en_vol += nb
+
+    def _reserver_admission(self, serveurs):
+        """Réserve la capacité du moteur puis un ticket d'admission par serveur (tout ou rien)."""
+        self._reserver(len(serveurs))
+        try:
+            return admission.demander(serveurs, origine="manuelle")
+        except Exception:
+            self._en_vol -= len(serveurs)
+            raise
+
+    def peut_accepter(self, serveur):
+        """Estimation sans réservation, pour refuser une exécution en direct avant d'ouvrir le flux."""
+        return self._en_vol < self.capacite and admission.peut_accepter(serveur)
+
+    async def _lancer(self, ticket, fonction, timeout, *args):
+        """Attend l'admission de `ticket` puis exécute `fonction(*args, annulation=...)` dans le pool dédié.
+
+        Le timeout (None = illimité) ne court qu'à partir du démarrage effectif, pas pendant
+        l'attente en file ; à expiration ou si la tâche asyncio est annulée, le canal SSH est fermé.
+        La place d'admission est rendue dès la fin de la commande (l'appelant la rend aussi, sans effet
+        si c'est déjà fait, au cas où la commande n'aurait jamais démarré).
+        """
+        await admission.attendre(ticket)
+        loop = asyncio.get_running_loop()
+        annulation = Annulation()
+        demarre = asyncio.Event()
+        soumis = time.perf_counter()
+
+        def tache():
+            metrics.execution_attente.observer(time.perf_counter() - soumis)
+            loop.call_soon_threadsafe(demarre.set)
+            with self._lock:
+                self._en_cours += 1
+            try:
+                return fonction(*args, annulation=annulation)
+            finally:
+                with self._lock:
+                    self._en_cours -= 1
+                admission.liberer(ticket)
+
+        future = loop.run_in_executor(self._executeur, tache)
+        attente = asyncio.ensure_future(demarre.wait())
+        try:
+            await asyncio.wait({future, attente}, return_when=asyncio.FIRST_COMPLETED)
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            annulation.annuler()
+            future.cancel()
+            raise
+        finally:
+            attente.cancel()
+
+    async def executer(self, serveur, script, timeout=None):
+        """Exécute `script` sur `serveur`, retourne (stdout, stderr)."""
+        ticket, = self._reserver_admission([serveur])
+        try:
+            return await self._lancer(ticket, pool_ssh.executer, timeout or EXECUTION_TIMEOUT, serveur, script)
+        finally:
+            admission.liberer(ticket)
+            self._en_vol -= 1
+
+    async def _executer_un(self, ticket, serveur, script, timeout):
+        debut = time.perf_counter()
+        try:
+            sortie, erreur = await self._lancer(ticket, pool_ssh.executer, timeout, serveur, script)
+            resultat = {"statut": "ok", "stdout": sortie, "stderr": erreur, "error": None}
+        except asyncio.TimeoutError:
+            resultat = {"statut": "timeout", "stdout": None, "stderr": None,
+                        "error": f"Timeout après {timeout:g} s"}
+        except Exception as e:
+            resultat = {"statut": "erreur", "stdout": None, "stderr": None, "error": str(e)}
+        finally:
+            admission.liberer(ticket)
+            self._en_vol -= 1
+        resultat["duree_ms"] = round((time.perf_counter() - debut) * 1000, 1)
+        resultat["attente_ms"] = round(ticket.attente() * 1000, 1)
+        resultat["serveur_id"] = serveur.id
+        resultat["nom"] = serveur.nom
+        return resultat
+
+    async def executer_sur_serveurs(self, serveurs, script, timeout=None):
+        """Exécute `script` en parallèle sur `serveurs`, retourne un résultat par serveur (même ordre).
+
+        Le timeout s'applique à chaque hôte, à partir du démarrage de sa commande. Seule une fenêtre
+        de serveurs est réservée (et peut être refusée) : chaque serveur terminé passe sa place au
+        suivant, si bien qu'un lot plus grand que la capacité du moteur s'exécute quand même.
+        """
+        timeout = timeout or EXECUTION_TIMEOUT
+        fenetre = min(len(serveurs), EXECUTION_FENETRE_MULTI, self.capacite, admission.lot_max())
+        tickets = self._reserver_admission(serveurs[:fenetre])
+        resultats = [None] * len(serveurs)
+        suivants = iter(range(fenetre, len(serveurs)))
+
+        async def enchainer(index, ticket):
+            while index is not None:
+                resultats[index] = await self._executer_un(ticket, serveurs[index], script, timeout)
+                index = next(suivants, None)
+                if index is not None:
+                    # Reprend la place que _executer_un vient de rendre : le lot déjà accepté n'est pas refusé
+                    self._en_vol += 1
+                    ticket, = admission.demander([serveurs[index]], origine="manuelle", rejeter=False)
+
+        try:
+            await asyncio.gather(*(enchainer(i, t) for i, t in enumerate(tickets)))
+        finally:
+            for ticket in tickets:
+                admission.liberer(ticket)
+        return resultats
+
+    async def flux(self, serveur, script, timeout=None):
+        """Version asynchrone de PoolSSH.flux : les blocs sont relayés par une file asyncio.
+
+        Sans `timeout`, la commande peut durer indéfiniment (suivi de scripts longs).
+        Tant que l'exécution attend son tour, produit ("file", {"position", "attente_s"}) chaque seconde.
+        """
+        ticket, = self._reserver_admission([serveur])
+        loop = asyncio.get_running_loop()
+        file = asyncio.Queue()
+
+        def lire(annulation):
+            try:
+                for element in pool_ssh.flux(serveur, script, timeout=timeout, annulation=annulation):
+                    loop.call_soon_threadsafe(file.put_nowait, element)
+            except Exception as e:
+                loop.call_soon_threadsafe(file.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(file.put_nowait, _FIN)
+
+        lecture = None
+        try:
+            while not ticket.admis:
+                yield "file", {"position": admission.position(ticket), "attente_s": round(ticket.attente(), 1)}
+                await admission.attendre(ticket, EXECUTION_RAFRAICHISSEMENT_FILE)
+            # Le timeout est géré par PoolSSH.flux ; annuler la lecture ferme le canal
+            lecture = asyncio.ensure_future(self._lancer(ticket, lire, None))
+            while True:
+                element = await file.get()
+                if element is _FIN:
+                    break
+                if isinstance(element, Exception):
+                    raise element
+                yield element
+        finally:
+            if lecture is not None and not lecture.done():
+                lecture.cancel()
+            admission.liberer(ticket)
+            self._en_vol -= 1
+
+    def statistiques(self):
+        return {
+            "concurrence": self.concurrence,
+            "capacite": self.capacite,
+            "en_cours": self._en_cours,
+            "en_vol": self._en_vol,
+        }
+
+
+moteur = MoteurExecution()
+
+metrics.Jauge("collecteur_execution_en_cours", "Commandes en cours dans le moteur d'exécution",
+              fonction=lambda: moteur._en_cours)
+metrics.Jauge("collecteur_execution_en_attente", "Commandes acceptées en attente d'un worker",
+              fonction=lambda: max(0, moteur._en_vol - moteur._en_cours))
+metrics.Jauge("collecteur_execution_capacite", "Capacité du moteur d'exécution (concurrence + file)",
+              fonction=lambda: moteur.capacite)
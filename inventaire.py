@@ -0,0 +1,236 @@
+import csv
+import io
+import json
+import os
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from database import SessionLocal
+from models import Groupe, Serveur
+
+try:
+    import yaml
+except ImportError:  # PyYAML absent : import et export YAML indisponibles
+    yaml = None
+
+# --- Inventaire des serveurs : import en masse (CSV, JSON, YAML) et export en flux ---
+# L'import valide toutes les lignes puis crée ou met à jour les serveurs (clé : nom) dans une seule
+# transaction ; une ligne invalide est signalée dans le rapport sans bloquer les autres.
+INVENTAIRE_LIGNES_MAX = int(os.environ.get("COLLECTEUR_INVENTAIRE_LIGNES_MAX", "20000"))
+FORMATS = ("csv", "json", "yaml")
+CHAMPS = ("nom", "adresse_ip", "utilisateur_ssh", "port_ssh", "chemin_cle_privee", "mot_de_passe", "groupes")
+# Vides dans le fichier : la valeur existante est conservée (un export sans secrets se réimporte tel quel)
+_CONSERVES_SI_VIDES = ("chemin_cle_privee", "mot_de_passe")
+_LOT = 500
+_ERREURS_LECTURE = (UnicodeDecodeError, csv.Error, ValueError) + ((yaml.YAMLError,) if yaml is not None else ())
+
+
+class InventaireError(ValueError):
+    """Fichier d'inventaire illisible (format, syntaxe, taille)."""
+
+
+def detecter_format(nom_fichier=None, format=None):
+    format = (format or os.path.splitext(nom_fichier or "")[1].lstrip(".")).lower()
+    format = {"yml": "yaml"}.get(format, format)
+    if format not in FORMATS:
+        raise InventaireError(f"Format d'inventaire inconnu : {format or '?'} (csv, json ou yaml)")
+    if format == "yaml" and yaml is None:
+        raise InventaireError("Format YAML indisponible : installer PyYAML")
+    return format
+
+
+def lire(contenu, format):
+    """Contenu brut d'un fichier d'inventaire → liste de dicts (une entrée par serveur)."""
+    try:
+        texte = contenu.decode("utf-8-sig") if isinstance(contenu, bytes) else contenu
+        if format == "csv":
+            lignes = list(csv.DictReader(io.StringIO(texte)))
+        else:
+            donnees = json.loads(texte) if format == "json" else yaml.safe_load(texte)
+            # Liste de serveurs, ou {"serveurs": [...]}
+            lignes = donnees.get("serveurs") if isinstance(donnees, dict) else donnees
+    except _ERREURS_LECTURE as e:
+        raise InventaireError(f"Fichier {format} illisible : {e}")
+    if not isinstance(lignes, list):
+        raise InventaireError("L'inventaire doit être une liste de serveurs")
+    if len(lignes) > INVENTAIRE_LIGNES_MAX:
+        raise InventaireError(f"Inventaire trop grand : {len(lignes)} lignes (maximum {INVENTAIRE_LIGNES_MAX})")
+    return lignes
+
+
+def _texte(valeur):
+    if valeur is None:
+        return None
+    valeur = str(valeur).strip()
+    return valeur or None
+
+
+def _valider(entree):
+    """Entrée brute → (colonnes du serveur, noms de groupes ou None) ; ValueError si invalide."""
+    if not isinstance(entree, dict):
+        raise ValueError("entrée non structurée (objet attendu)")
+    inconnues = set(entree) - set(CHAMPS) - {"id"}
+    if inconnues:
+        raise ValueError("colonne(s) inconnue(s) : " + ", ".join(sorted(str(c) for c in inconnues)))
+    valeurs = {}
+    for champ in ("nom", "adresse_ip", "utilisateur_ssh"):
+        valeurs[champ] = _texte(entree.get(champ))
+        if not valeurs[champ]:
+            raise ValueError(f"{champ} obligatoire")
+    port = _texte(entree.get("port_ssh"))
+    try:
+        valeurs["port_ssh"] = int(port) if port else 22
+    except ValueError:
+        raise ValueError(f"port_ssh invalide : {port}")
+    if not 1 <= valeurs["port_ssh"] <= 65535:
+        raise ValueError(f"port_ssh hors limites : {valeurs['port_ssh']}")
+    for champ in _CONSERVES_SI_VIDES:
+        if _texte(entree.get(champ)):
+            valeurs[champ] = _texte(entree.get(champ))
+    groupes = None
+    if "groupes" in entree:
+        brut = entree["groupes"]
+        if isinstance(brut, str):
+            brut = brut.replace(",", ";").split(";")
+        elif brut is None:
+            brut = []
+        elif not isinstance(brut, list):
+            raise ValueError("groupes : liste ou texte « a;b » attendu")
+        groupes = list(dict.fromkeys(n for n in (_texte(g) for g in brut) if n))
+    return valeurs, groupes
+
+
+def _par_lots(valeurs):
+    valeurs = list(valeurs)
+    for i in range(0, len(valeurs), _LOT):
+        yield valeurs[i:i + _LOT]
+
+
+def importer(db, entrees, simulation=False):
+    """Crée ou met à jour les serveurs de `entrees` (clé : nom) en une transaction ; retourne le rapport.
+
+    Avec `simulation`, tout est validé mais rien n'est enregistré.
+    """
+    rapport = {"total": len(entrees), "crees": 0, "mis_a_jour": 0, "inchanges": 0, "erreurs": [],
+               "simulation": simulation}
+    valides = []
+    noms, adresses = {}, {}
+    for numero, entree in enumerate(entrees, start=1):
+        try:
+            valeurs, groupes = _valider(entree)
+            if valeurs["nom"] in noms:
+                raise ValueError(f"nom en double (ligne {noms[valeurs['nom']]})")
+            if valeurs["adresse_ip"] in adresses:
+                raise ValueError(f"adresse_ip en double (ligne {adresses[valeurs['adresse_ip']]})")
+        except ValueError as e:
+            nom = entree.get("nom") if isinstance(entree, dict) else None
+            rapport["erreurs"].append({"ligne": numero, "nom": nom, "erreur": str(e)})
+            continue
+        noms[valeurs["nom"]] = numero
+        adresses[valeurs["adresse_ip"]] = numero
+        valides.append((numero, valeurs, groupes))
+
+    # Serveurs et groupes existants, chargés par lots (une requête par tranche de _LOT)
+    existants = {}
+    for lot in _par_lots(noms):
+        for serveur in db.query(Serveur).options(selectinload(Serveur.groupes)).filter(Serveur.nom.in_(lot)):
+            existants[serveur.nom] = serveur
+    proprietaires_ip = {}
+    for lot in _par_lots(adresses):
+        for nom, adresse in db.query(Serveur.nom, Serveur.adresse_ip).filter(Serveur.adresse_ip.in_(lot)):
+            proprietaires_ip[adresse] = nom
+    noms_groupes = {g for _, _, groupes in valides for g in groupes or ()}
+    groupes_connus = {}
+    for lot in _par_lots(noms_groupes):
+        for groupe in db.query(Groupe).filter(Groupe.nom.in_(lot)):
+            groupes_connus[groupe.nom] = groupe
+
+    nouveaux = []
+    for numero, valeurs, groupes in valides:
+        proprietaire = proprietaires_ip.get(valeurs["adresse_ip"])
+        if proprietaire is not None and proprietaire != valeurs["nom"]:
+            rapport["erreurs"].append({"ligne": numero, "nom": valeurs["nom"],
+                                       "erreur": f"adresse_ip déjà utilisée par le serveur {proprietaire}"})
+            continue
+        if groupes is not None:
+            for nom_groupe in groupes:
+                if nom_groupe not in groupes_connus:
+                    groupes_connus[nom_groupe] = Groupe(nom=nom_groupe)
+                    db.add(groupes_connus[nom_groupe])
+            groupes = [groupes_connus[n] for n in groupes]
+        serveur = existants.get(valeurs["nom"])
+        if serveur is None:
+            serveur = Serveur(**valeurs)
+            serveur.groupes = groupes or []
+            nouveaux.append(serveur)
+            rapport["crees"] += 1
+            continue
+        modifie = False
+        for champ, valeur in valeurs.items():
+            if getattr(serveur, champ) != valeur:
+                setattr(serveur, champ, valeur)
+                modifie = True
+        if groupes is not None and {g.nom for g in serveur.groupes} != {g.nom for g in groupes}:
+            serveur.groupes = groupes
+            modifie = True
+        rapport["mis_a_jour" if modifie else "inchanges"] += 1
+    db.add_all(nouveaux)
+    if simulation:
+        db.rollback()
+    else:
+        db.commit()
+    return rapport
+
+
+def _ligne(serveur, avec_secrets):
+    ligne = {
+        "nom": serveur.nom,
+        "adresse_ip": serveur.adresse_ip,
+        "utilisateur_ssh": serveur.utilisateur_ssh,
+        "port_ssh": serveur.port_ssh,
+        "chemin_cle_privee": serveur.chemin_cle_privee,
+        "groupes": sorted(g.nom for g in serveur.groupes),
+    }
+    if avec_secrets:
+        ligne["mot_de_passe"] = serveur.mot_de_passe
+    return ligne
+
+
+def exporter(format, avec_secrets=False, lot=1000):
+    """Générateur de l'inventaire complet dans `format`, lu par lots (mémoire bornée, réimportable)."""
+    db = SessionLocal()
+    try:
+        serveurs = db.execute(
+            select(Serveur).options(selectinload(Serveur.groupes)).order_by(Serveur.id)
+            .execution_options(yield_per=lot)
+        ).scalars()
+        if format == "csv":
+            tampon = io.StringIO()
+            colonnes = [c for c in CHAMPS if avec_secrets or c != "mot_de_passe"]
+            ecrivain = csv.DictWriter(tampon, fieldnames=colonnes)
+            ecrivain.writeheader()
+            for i, serveur in enumerate(serveurs, start=1):
+                ligne = _ligne(serveur, avec_secrets)
+                ligne["groupes"] = ";".join(ligne["groupes"])
+                ecrivain.writerow(ligne)
+                if i % lot == 0:
+                    yield tampon.getvalue()
+                    tampon.seek(0)
+                    tampon.truncate()
+            yield tampon.getvalue()
+        elif format == "json":
+            yield "["
+            for i, serveur in enumerate(serveurs):
+                yield ("," if i else "") + "\n  " + json.dumps(_ligne(serveur, avec_secrets), ensure_ascii=False)
+            yield "\n]\n"
+        else:
+            # Une liste YAML se concatène élément par élément
+            vide = True
+            for serveur in serveurs:
+                vide = False
+                yield yaml.safe_dump([_ligne(serveur, avec_secrets)], allow_unicode=True, sort_keys=False)
+            if vide:
+                yield "[]\n"
+    finally:
+        db.close()
@@ -1,30 +1,47 @@
-from fastapi import FastAPI, Depends, HTTPException, Body, Form
-from sqlalchemy.orm import Session
+import time
+_DEBUT_IMPORT = time.perf_counter()  # durée d'import de l'application, exposée dans /metrics
+
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Body, Form, UploadFile, File
+from sqlalchemy.orm import Session, joinedload, selectinload, undefer
+from sqlalchemy import and_, or_, func, tuple_
 from database import init_db, SessionLocal
-from models import Serveur, LogExecution, TachePlanifiee
+from models import Serveur, LogExecution, TachePlanifiee, Groupe
 from pydantic import BaseModel
-from typing import List
-import paramiko
+from typing import List, Optional, Union
+from ssh_pool import pool_ssh
+from execution import moteur, SurchargeError
+from admission import admission, AdmissionRefuseeError, ADMISSION_REESSAI, PRIORITES, PRIORITE_DEFAUT
+from starlette.concurrency import run_in_threadpool
+import asyncio
+from stockage_logs import SortieBornee
+from retention import purger_logs
+from sante import cache_sante, SANTE_INTERVALLE
+import metrics
+from cache import cache
+from ecrivain_logs import ecrivain_logs
+import inventaire
+from comparaison import agreger as agreger_lot, lots_recents, nouveau_lot
+from recherche import initialiser as initialiser_recherche, indexer_manquants, rechercher, RECHERCHE_PAR_PAGE
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi import Request
-from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse, Response
 from starlette.middleware.sessions import SessionMiddleware
 import hashlib
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
+from recurrence import analyser as analyser_recurrence, decalage, POLITIQUES, POLITIQUE_DEFAUT
+from planificateur import scheduler, travailleur, demarrer as demarrer_planificateur, arreter as arreter_planificateur, synchroniser_tache, MODE
 import threading
-import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 import subprocess
+import json
+import uuid
 
-app = FastAPI()
+# Routes de l'application ; l'application elle-même est construite par creer_app() (en fin de module)
+routeur = APIRouter()
 
-init_db()
-
-# Configuration Jinja2 et fichiers statiques
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Configuration Jinja2 (les fichiers statiques sont montés par creer_app)
 templates = Jinja2Templates(directory="templates")
 
 # Dépendance pour obtenir une session DB
@@ -35,6 +52,14 @@ def get_db():
     finally:
         db.close()
 
+# Accès DB depuis les handlers async : exécutés dans le threadpool pour ne pas bloquer la boucle.
+# La session est fermée après chargement pour rendre la connexion au pool pendant l'exécution SSH
+# (les objets restent utilisables, détachés avec leurs attributs chargés).
+def _charger_serveur(db, serveur_id):
+    serveur = db.query(Serveur).filter(Serveur.id == serveur_id).first()
+    db.close()
+    return serveur
+
 # Schémas Pydantic
 class ServeurCreate(BaseModel):
     nom: str
@@ -58,18 +83,30 @@ class ServeurRead(BaseModel):
 class ScriptExecutionRequest(BaseModel):
     script: str  # Le script shell à exécuter
 
+class GroupeCreate(BaseModel):
+    nom: str
+    description: Optional[str] = None
+
+class ExecutionMultiRequest(BaseModel):
+    script: str
+    serveurs: Union[List[int], str] = "all"  # liste d'IDs ou sélecteur "all", "groupe:<nom>"
+    timeout: Optional[float] = None  # secondes, par hôte
+
 # --- Configuration utilisateur admin (à améliorer pour la prod) ---
 ADMIN_USERNAME = "admin"
 # Mot de passe haché SHA256 (exemple pour 'collecteur2024')
 ADMIN_PASSWORD_HASH = hashlib.sha256("collecteur2024".encode()).hexdigest()
 
-app.add_middleware(SessionMiddleware, secret_key="supersecretkey123")
+# --- Dépendance de sécurité ---
+def require_login(request: Request):
+    if request.session.get("user") != ADMIN_USERNAME:
+        raise HTTPException(status_code=303, detail="Non authentifié", headers={"Location": "/login"})
 
-@app.get("/")
+@routeur.get("/")
 def lire_racine():
     return {"message": "Bienvenue sur Le Collecteur !"}
 
-@app.post("/serveurs/", response_model=ServeurRead)
+@routeur.post("/serveurs/", response_model=ServeurRead)
 def creer_serveur(serveur: ServeurCreate, db: Session = Depends(get_db)):
     db_serveur = Serveur(**serveur.dict())
     db.add(db_serveur)
@@ -81,51 +118,97 @@ def creer_serveur(serveur: ServeurCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Erreur lors de la création du serveur : " + str(e))
     return db_serveur
 
-@app.get("/serveurs/", response_model=List[ServeurRead])
-def lister_serveurs(db: Session = Depends(get_db)):
-    return db.query(Serveur).all()
+@routeur.get("/serveurs/", response_model=List[ServeurRead])
+def lister_serveurs(request: Request):
+    return _reponse_conditionnelle(request, ("serveurs",), lambda: Response(cache.obtenir(
+        ("json", "serveurs"), ("serveurs",),
+        lambda: JSONResponse([ServeurRead.from_orm(s).dict() for s in _serveurs_en_cache()]).body), media_type="application/json"))
 
-@app.delete("/serveurs/{serveur_id}")
+@routeur.delete("/serveurs/{serveur_id}")
 def supprimer_serveur(serveur_id: int, db: Session = Depends(get_db)):
     serveur = db.query(Serveur).filter(Serveur.id == serveur_id).first()
     if not serveur:
         raise HTTPException(status_code=404, detail="Serveur non trouvé")
     db.delete(serveur)
     db.commit()
+    pool_ssh.fermer_hote(serveur_id)
     return {"ok": True}
 
-@app.post("/serveurs/{serveur_id}/executer_script")
-def executer_script_ssh(serveur_id: int, data: ScriptExecutionRequest = Body(...), db: Session = Depends(get_db)):
-    serveur = db.query(Serveur).filter(Serveur.id == serveur_id).first()
+@routeur.post("/serveurs/{serveur_id}/executer_script")
+async def executer_script_ssh(serveur_id: int, data: ScriptExecutionRequest = Body(...), db: Session = Depends(get_db)):
+    serveur = await run_in_threadpool(_charger_serveur, db, serveur_id)
     if not serveur:
         raise HTTPException(status_code=404, detail="Serveur non trouvé")
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     try:
-        connect_args = {
-            "hostname": serveur.adresse_ip,
-            "port": serveur.port_ssh,
-            "username": serveur.utilisateur_ssh,
-        }
-        if serveur.chemin_cle_privee:
-            connect_args["key_filename"] = serveur.chemin_cle_privee
-        elif serveur.mot_de_passe:
-            connect_args["password"] = serveur.mot_de_passe
-        ssh.connect(**connect_args)
-        stdin, stdout, stderr = ssh.exec_command(data.script)
-        sortie = stdout.read().decode()
-        erreur = stderr.read().decode()
-        ssh.close()
+        sortie, erreur = await moteur.executer(serveur, data.script)
         return {"stdout": sortie, "stderr": erreur}
+    except (SurchargeError, AdmissionRefuseeError) as e:
+        raise _refus_surcharge(e)
+    except asyncio.TimeoutError:
+        return {"error": "Timeout"}
     except Exception as e:
         return {"error": str(e)}
 
+def _refus_surcharge(e):
+    """Exécution refusée faute de place (moteur ou file d'admission) : 429, à retenter plus tard."""
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(ADMISSION_REESSAI)})
+
+def _selectionner_serveurs(db, selection):
+    """Résout une sélection (liste d'IDs, "all" ou "groupe:<nom>") en (serveurs, IDs introuvables)."""
+    if isinstance(selection, str):
+        if selection == "all":
+            return db.query(Serveur).order_by(Serveur.id).all(), []
+        if selection.startswith("groupe:"):
+            groupe = db.query(Groupe).filter(Groupe.nom == selection[len("groupe:"):]).first()
+            if not groupe:
+                raise HTTPException(status_code=404, detail="Groupe non trouvé : " + selection[len("groupe:"):])
+            return db.query(Serveur).join(Serveur.groupes).filter(Groupe.id == groupe.id).order_by(Serveur.id).all(), []
+        raise HTTPException(status_code=400, detail="Sélecteur inconnu : " + selection)
+    serveurs = db.query(Serveur).filter(Serveur.id.in_(selection)).order_by(Serveur.id).all()
+    trouves = {s.id for s in serveurs}
+    return serveurs, [i for i in dict.fromkeys(selection) if i not in trouves]
+
+def _charger_selection(db, selection):
+    serveurs, introuvables = _selectionner_serveurs(db, selection)
+    db.close()
+    return serveurs, introuvables
+
+def _ecrire_lot(logs):
+    # Écrits avant la réponse : le lot_id retourné est aussitôt consultable (GET /lots/{lot_id})
+    ecrivain_logs.ajouter_logs(logs)
+    ecrivain_logs.vider()
+
+@routeur.post("/executer_script_multi")
+async def executer_script_multi(data: ExecutionMultiRequest = Body(...), db: Session = Depends(get_db), user: str = Depends(require_login)):
+    serveurs, introuvables = await run_in_threadpool(_charger_selection, db, data.serveurs)
+    debut = time.perf_counter()
+    try:
+        resultats = await moteur.executer_sur_serveurs(serveurs, data.script, timeout=data.timeout)
+    except (SurchargeError, AdmissionRefuseeError) as e:
+        raise _refus_surcharge(e)
+    duree_ms = round((time.perf_counter() - debut) * 1000, 1)
+    # Un log par hôte, écrits en transactions groupées par l'écrivain de logs ; le lot permet de les comparer
+    lot_id = nouveau_lot()
+    await run_in_threadpool(_ecrire_lot, [
+        LogExecution(serveur_id=r["serveur_id"], script=data.script, stdout=r["stdout"], stderr=r["stderr"], error=r["error"], lot_id=lot_id)
+        for r in resultats
+    ])
+    resultats += [{"serveur_id": i, "nom": None, "statut": "introuvable", "stdout": None, "stderr": None, "error": "Serveur non trouvé", "duree_ms": 0, "attente_ms": 0} for i in introuvables]
+    return {
+        "lot_id": lot_id,
+        "total": len(resultats),
+        "succes": sum(1 for r in resultats if r["statut"] == "ok"),
+        "echecs": sum(1 for r in resultats if r["statut"] != "ok"),
+        "duree_ms": duree_ms,
+        "resultats": resultats,
+    }
+
 # --- Page de connexion ---
-@app.get("/login", response_class=HTMLResponse)
+@routeur.get("/login", response_class=HTMLResponse)
 def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request, "error": None})
 
-@app.post("/login", response_class=HTMLResponse)
+@routeur.post("/login", response_class=HTMLResponse)
 def login_action(request: Request, username: str = Form(...), password: str = Form(...)):
     password_hash = hashlib.sha256(password.encode()).hexdigest()
     if username == ADMIN_USERNAME and password_hash == ADMIN_PASSWORD_HASH:
@@ -134,16 +217,11 @@ def login_action(request: Request, username: str = Form(...), password: str = Fo
     else:
         return templates.TemplateResponse("login.html", {"request": request, "error": "Identifiants invalides"})
 
-@app.get("/logout")
+@routeur.get("/logout")
 def logout(request: Request):
     request.session.clear()
     return RedirectResponse(url="/login", status_code=303)
 
-# --- Dépendance de sécurité ---
-def require_login(request: Request):
-    if request.session.get("user") != ADMIN_USERNAME:
-        raise HTTPException(status_code=303, detail="Non authentifié", headers={"Location": "/login"})
-
 # --- Utilitaire pour notifications ---
 def set_notification(request, message, type_="success"):
     request.session["notification"] = {"message": message, "type": type_}
@@ -152,16 +230,113 @@ def pop_notification(request):
     notif = request.session.pop("notification", None)
     return notif
 
+# --- Cache des pages et listes (versions invalidées à chaque écriture, voir cache.py) ---
+def _serveurs_en_cache():
+    """Inventaire (avec groupes), détaché de toute session et partagé jusqu'à la prochaine modification."""
+    def charger():
+        db = SessionLocal()
+        try:
+            return db.query(Serveur).options(selectinload(Serveur.groupes)).order_by(Serveur.id).all()
+        finally:
+            db.close()
+    return cache.obtenir("serveurs", ("serveurs",), charger)
+
+def _reponse_conditionnelle(request, domaines, construire):
+    """304 si le client a déjà la version courante des `domaines`, sinon `construire()` avec ETag et Last-Modified."""
+    entetes = cache.entetes(*domaines)
+    if cache.non_modifie(request.headers, entetes):
+        return Response(status_code=304, headers=entetes)
+    reponse = construire()
+    reponse.headers.update(entetes)
+    return reponse
+
+def _page_en_cache(request, gabarit, domaines, contexte):
+    """Page rendue une fois par version des données ; une notification en attente force un rendu complet."""
+    notif = pop_notification(request)
+    if notif:
+        return templates.TemplateResponse(gabarit, dict(contexte(), request=request, notification=notif))
+    return _reponse_conditionnelle(request, domaines, lambda: HTMLResponse(
+        cache.obtenir(("page", gabarit), domaines, lambda: templates.get_template(gabarit).render(contexte()))))
+
+# --- Inventaire : import en masse et export ---
+@routeur.post("/serveurs/import")
+async def importer_inventaire(fichier: UploadFile = File(...), format: Optional[str] = Form(None), simulation: bool = Form(False), db: Session = Depends(get_db), user: str = Depends(require_login)):
+    try:
+        format = inventaire.detecter_format(fichier.filename, format)
+        entrees = inventaire.lire(await fichier.read(), format)
+    except inventaire.InventaireError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_in_threadpool(inventaire.importer, db, entrees, simulation)
+
+@routeur.get("/serveurs/export")
+def exporter_inventaire(format: str = "csv", secrets: bool = False, user: str = Depends(require_login)):
+    try:
+        format = inventaire.detecter_format(format=format)
+    except inventaire.InventaireError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    types = {"csv": "text/csv", "json": "application/json", "yaml": "application/yaml"}
+    return StreamingResponse(inventaire.exporter(format, avec_secrets=secrets), media_type=types[format],
+                             headers={"Content-Disposition": f'attachment; filename="inventaire.{format}"'})
+
+# --- Groupes de serveurs (cibles d'exécution et de tâches planifiées) ---
+@routeur.get("/groupes")
+def lister_groupes(request: Request, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    def construire():
+        nb_serveurs = dict(db.query(Groupe.id, func.count(Serveur.id)).outerjoin(Groupe.serveurs).group_by(Groupe.id).all())
+        return JSONResponse([{"id": g.id, "nom": g.nom, "description": g.description, "nb_serveurs": nb_serveurs.get(g.id, 0)}
+                             for g in db.query(Groupe).order_by(Groupe.nom)])
+    return _reponse_conditionnelle(request, ("serveurs",), construire)
+
+@routeur.post("/groupes")
+def creer_groupe(groupe: GroupeCreate, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    if db.query(Groupe).filter(Groupe.nom == groupe.nom).first():
+        raise HTTPException(status_code=400, detail="Un groupe porte déjà ce nom")
+    db_groupe = Groupe(nom=groupe.nom, description=groupe.description)
+    db.add(db_groupe)
+    db.commit()
+    return {"id": db_groupe.id, "nom": db_groupe.nom, "description": db_groupe.description}
+
+@routeur.delete("/groupes/{groupe_id}")
+def supprimer_groupe(groupe_id: int, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    groupe = db.query(Groupe).filter(Groupe.id == groupe_id).first()
+    if not groupe:
+        raise HTTPException(status_code=404, detail="Groupe non trouvé")
+    nb_taches = db.query(TachePlanifiee).filter(TachePlanifiee.groupe_id == groupe_id).count()
+    if nb_taches:
+        raise HTTPException(status_code=409, detail=f"Groupe utilisé par {nb_taches} tâche(s) planifiée(s)")
+    db.delete(groupe)
+    db.commit()
+    return {"ok": True}
+
+@routeur.post("/groupes/{groupe_id}/serveurs")
+def ajouter_serveurs_groupe(groupe_id: int, serveurs: List[int] = Body(...), db: Session = Depends(get_db), user: str = Depends(require_login)):
+    groupe = db.query(Groupe).options(selectinload(Groupe.serveurs)).filter(Groupe.id == groupe_id).first()
+    if not groupe:
+        raise HTTPException(status_code=404, detail="Groupe non trouvé")
+    trouves = db.query(Serveur).filter(Serveur.id.in_(serveurs)).all()
+    membres = {s.id for s in groupe.serveurs}
+    groupe.serveurs.extend(s for s in trouves if s.id not in membres)
+    db.commit()
+    ids_trouves = {s.id for s in trouves}
+    return {"nb_serveurs": len(groupe.serveurs), "introuvables": [i for i in dict.fromkeys(serveurs) if i not in ids_trouves]}
+
+@routeur.delete("/groupes/{groupe_id}/serveurs/{serveur_id}")
+def retirer_serveur_groupe(groupe_id: int, serveur_id: int, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    groupe = db.query(Groupe).filter(Groupe.id == groupe_id).first()
+    if not groupe:
+        raise HTTPException(status_code=404, detail="Groupe non trouvé")
+    groupe.serveurs = [s for s in groupe.serveurs if s.id != serveur_id]
+    db.commit()
+    return {"ok": True}
+
 # --- Protection des routes web ---
 from fastapi import Depends
 
-@app.get("/serveurs_html")
-def page_serveurs(request: Request, db: Session = Depends(get_db), user: str = Depends(require_login)):
-    serveurs = db.query(Serveur).all()
-    notif = pop_notification(request)
-    return templates.TemplateResponse("serveurs.html", {"request": request, "serveurs": serveurs, "notification": notif})
+@routeur.get("/serveurs_html")
+def page_serveurs(request: Request, user: str = Depends(require_login)):
+    return _page_en_cache(request, "serveurs.html", ("serveurs",), lambda: {"serveurs": _serveurs_en_cache()})
 
-@app.post("/ajouter_serveur_html")
+@routeur.post("/ajouter_serveur_html")
 def ajouter_serveur_html(
     nom: str = Form(...),
     adresse_ip: str = Form(...),
@@ -190,23 +365,39 @@ def ajouter_serveur_html(
         set_notification(request, "Erreur lors de l'ajout du serveur.", "error")
     return RedirectResponse(url="/serveurs_html", status_code=303)
 
-@app.post("/supprimer_serveur_html")
+@routeur.post("/importer_serveurs_html")
+async def importer_serveurs_html(fichier: UploadFile = File(...), db: Session = Depends(get_db), user: str = Depends(require_login), request: Request = None):
+    try:
+        entrees = inventaire.lire(await fichier.read(), inventaire.detecter_format(fichier.filename))
+    except inventaire.InventaireError as e:
+        set_notification(request, f"Import impossible : {e}", "error")
+        return RedirectResponse(url="/serveurs_html", status_code=303)
+    rapport = await run_in_threadpool(inventaire.importer, db, entrees)
+    message = f"Import : {rapport['crees']} créé(s), {rapport['mis_a_jour']} mis à jour, {rapport['inchanges']} inchangé(s)"
+    if rapport["erreurs"]:
+        message += f", {len(rapport['erreurs'])} ligne(s) en erreur — " + " ; ".join(
+            f"ligne {e['ligne']} : {e['erreur']}" for e in rapport["erreurs"][:5])
+    set_notification(request, message, "error" if rapport["erreurs"] else "success")
+    return RedirectResponse(url="/serveurs_html", status_code=303)
+
+@routeur.post("/supprimer_serveur_html")
 def supprimer_serveur_html(serveur_id: int = Form(...), db: Session = Depends(get_db), user: str = Depends(require_login), request: Request = None):
     serveur = db.query(Serveur).filter(Serveur.id == serveur_id).first()
     if serveur:
         db.delete(serveur)
         db.commit()
+        pool_ssh.fermer_hote(serveur_id)
         set_notification(request, "Serveur supprimé.", "success")
     else:
         set_notification(request, "Serveur introuvable.", "error")
     return RedirectResponse(url="/serveurs_html", status_code=303)
 
-@app.get("/editer_serveur_html")
+@routeur.get("/editer_serveur_html")
 def editer_serveur_html(request: Request, serveur_id: int, db: Session = Depends(get_db), user: str = Depends(require_login)):
     serveur = db.query(Serveur).filter(Serveur.id == serveur_id).first()
     return templates.TemplateResponse("editer_serveur.html", {"request": request, "serveur": serveur})
 
-@app.post("/editer_serveur_html")
+@routeur.post("/editer_serveur_html")
 def enregistrer_edition_serveur_html(
     serveur_id: int = Form(...),
     nom: str = Form(...),
@@ -229,6 +420,7 @@ def enregistrer_edition_serveur_html(
         serveur.mot_de_passe = mot_de_passe
         try:
             db.commit()
+            pool_ssh.fermer_hote(serveur_id)
             set_notification(request, "Serveur modifié avec succès.", "success")
         except Exception:
             db.rollback()
@@ -237,81 +429,255 @@ def enregistrer_edition_serveur_html(
         set_notification(request, "Serveur introuvable.", "error")
     return RedirectResponse(url="/serveurs_html", status_code=303)
 
-@app.post("/executer_script_html")
-def executer_script_html(
+def _enregistrer_et_lister(db, log):
+    if log is not None:
+        ecrivain_logs.ajouter(log)
+    return _serveurs_en_cache()
+
+@routeur.post("/executer_script_html")
+async def executer_script_html(
     serveur_id: int = Form(...),
     script: str = Form(...),
     db: Session = Depends(get_db),
     request: Request = None,
     user: str = Depends(require_login)
 ):
-    serveur = db.query(Serveur).filter(Serveur.id == serveur_id).first()
+    serveur = await run_in_threadpool(_charger_serveur, db, serveur_id)
     resultat = None
+    statut = 200
     log = LogExecution(serveur_id=serveur_id, script=script)
     if serveur:
-        import paramiko
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         try:
-            connect_args = {
-                "hostname": serveur.adresse_ip,
-                "port": serveur.port_ssh,
-                "username": serveur.utilisateur_ssh,
-            }
-            if serveur.chemin_cle_privee:
-                connect_args["key_filename"] = serveur.chemin_cle_privee
-            elif serveur.mot_de_passe:
-                connect_args["password"] = serveur.mot_de_passe
-            ssh.connect(**connect_args)
-            stdin, stdout, stderr = ssh.exec_command(script)
-            sortie = stdout.read().decode()
-            erreur = stderr.read().decode()
+            sortie, erreur = await moteur.executer(serveur, script)
             log.stdout = sortie
             log.stderr = erreur
             resultat = {"stdout": sortie, "stderr": erreur}
-            ssh.close()
             set_notification(request, "Script exécuté avec succès.", "success")
-        except Exception as e:
-            log.error = str(e)
+        except (SurchargeError, AdmissionRefuseeError) as e:
+            # Refusée avant d'avoir démarré : rien n'a été exécuté, pas de log
+            log = None
+            statut = 429
             resultat = {"error": str(e)}
-            set_notification(request, f"Erreur lors de l'exécution : {str(e)}", "error")
-    db.add(log)
-    db.commit()
-    serveurs = db.query(Serveur).all()
+            set_notification(request, f"Exécution refusée, réessayer dans quelques secondes : {e}", "error")
+        except Exception as e:
+            message = "Timeout" if isinstance(e, asyncio.TimeoutError) else str(e)
+            log.error = message
+            resultat = {"error": message}
+            set_notification(request, f"Erreur lors de l'exécution : {message}", "error")
+    serveurs = await run_in_threadpool(_enregistrer_et_lister, db, log)
     notif = pop_notification(request)
-    return templates.TemplateResponse("serveurs.html", {"request": request, "serveurs": serveurs, "resultat": resultat, "serveur_id_resultat": serveur_id, "notification": notif})
+    return templates.TemplateResponse("serveurs.html", {"request": request, "serveurs": serveurs, "resultat": resultat, "serveur_id_resultat": serveur_id, "notification": notif}, status_code=statut)
+
+# --- Exécution en direct (server-sent events) ---
+def _evenement_sse(donnees, evenement=None):
+    entete = f"event: {evenement}\n" if evenement else ""
+    return f"{entete}data: {json.dumps(donnees)}\n\n"
+
+# Le script est transmis par un POST authentifié ; le flux (GET, EventSource) ne porte que l'identifiant
+# de l'exécution, à usage unique : un lien ou une redirection depuis un autre site ne peut rien lancer.
+EXECUTION_DIRECTE_DELAI = 60  # secondes pour ouvrir le flux après la préparation
+_executions_directes = {}
+_executions_directes_lock = threading.Lock()
+
+@routeur.post("/serveurs/{serveur_id}/executions_directes")
+async def preparer_execution_directe(serveur_id: int, data: ScriptExecutionRequest = Body(...), db: Session = Depends(get_db), user: str = Depends(require_login)):
+    serveur = await run_in_threadpool(_charger_serveur, db, serveur_id)
+    if not serveur:
+        raise HTTPException(status_code=404, detail="Serveur non trouvé")
+    if not moteur.peut_accepter(serveur):
+        raise _refus_surcharge("Capacité d'exécution atteinte, réessayer dans quelques secondes")
+    execution_id = uuid.uuid4().hex
+    maintenant = time.monotonic()
+    with _executions_directes_lock:
+        for cle in [c for c, (_, _, expire) in _executions_directes.items() if expire < maintenant]:
+            del _executions_directes[cle]
+        _executions_directes[execution_id] = (serveur_id, data.script, maintenant + EXECUTION_DIRECTE_DELAI)
+    return {"execution_id": execution_id, "flux": f"/executions_directes/{execution_id}/flux"}
+
+@routeur.get("/executions_directes/{execution_id}/flux")
+async def executer_script_stream(execution_id: str, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    with _executions_directes_lock:
+        entree = _executions_directes.pop(execution_id, None)
+    if entree is None or entree[2] < time.monotonic():
+        raise HTTPException(status_code=404, detail="Exécution inconnue, expirée ou déjà suivie")
+    serveur_id, script, _ = entree
+    serveur = await run_in_threadpool(_charger_serveur, db, serveur_id)
+    if not serveur:
+        raise HTTPException(status_code=404, detail="Serveur non trouvé")
 
-@app.get("/logs_html")
-def logs_html(request: Request, serveur_id: int, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    async def evenements():
+        sorties = {"stdout": SortieBornee(), "stderr": SortieBornee()}
+        log = LogExecution(serveur_id=serveur_id, script=script)
+        code_retour = None
+        refus = None
+        log_id = None
+        try:
+            async for flux, texte in moteur.flux(serveur, script):
+                if flux == "file":
+                    # En attente d'admission : position et temps d'attente
+                    yield _evenement_sse(texte, "file")
+                    continue
+                if flux == "exit":
+                    code_retour = texte
+                    continue
+                sorties[flux].ajouter(texte)
+                yield _evenement_sse({"flux": flux, "t": datetime.utcnow().isoformat(timespec="milliseconds"), "data": texte})
+        except (SurchargeError, AdmissionRefuseeError) as e:
+            # Refusée entre la vérification et le démarrage : rien n'a été exécuté
+            refus = str(e)
+        except Exception as e:
+            log.error = str(e)
+        finally:
+            # Le log est écrit même si le navigateur a fermé la connexion en cours de route
+            if refus is None:
+                log.stdout = sorties["stdout"].texte()
+                log.stderr = sorties["stderr"].texte()
+                log_id = await asyncio.shield(run_in_threadpool(ecrivain_logs.ecrire, log))
+        yield _evenement_sse({"code_retour": code_retour, "error": refus or log.error, "log_id": log_id}, "fin")
+
+    return StreamingResponse(evenements(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Historique paginé par curseur (date_execution, id), servi par l'index ix_logs_serveur_date ---
+LOGS_PAR_PAGE = 50
+LOGS_PAR_PAGE_MAX = 500
+
+def _encoder_curseur(log):
+    return f"{log.date_execution.isoformat()}_{log.id}"
+
+def _page_logs(db, serveur_id, curseur=None, limite=LOGS_PAR_PAGE, sorties=False):
+    requete = db.query(LogExecution).filter(LogExecution.serveur_id == serveur_id)
+    if curseur:
+        try:
+            date_curseur, id_curseur = curseur.rsplit("_", 1)
+            date_curseur, id_curseur = datetime.fromisoformat(date_curseur), int(id_curseur)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Curseur invalide")
+        # Comparaison de tuples : parcours de l'index à partir du curseur, quelle que soit la profondeur
+        requete = requete.filter(tuple_(LogExecution.date_execution, LogExecution.id) < (date_curseur, id_curseur))
+    if sorties:
+        requete = requete.options(undefer(LogExecution.stdout), undefer(LogExecution.stderr))
+    limite = max(1, min(limite, LOGS_PAR_PAGE_MAX))
+    # Une ligne de plus pour savoir s'il existe une page suivante
+    logs = requete.order_by(LogExecution.date_execution.desc(), LogExecution.id.desc()).limit(limite + 1).all()
+    suivant = _encoder_curseur(logs[limite - 1]) if len(logs) > limite else None
+    return logs[:limite], suivant
+
+@routeur.get("/logs_html")
+def logs_html(request: Request, serveur_id: int, curseur: Optional[str] = None, db: Session = Depends(get_db), user: str = Depends(require_login)):
     serveur = db.query(Serveur).filter(Serveur.id == serveur_id).first()
-    logs = db.query(LogExecution).filter(LogExecution.serveur_id == serveur_id).order_by(LogExecution.date_execution.desc()).all()
-    return templates.TemplateResponse("logs.html", {"request": request, "serveur": serveur, "logs": logs})
-
-@app.get("/dashboard_html")
+    logs, curseur_suivant = _page_logs(db, serveur_id, curseur)
+    return templates.TemplateResponse("logs.html", {"request": request, "serveur": serveur, "logs": logs, "curseur": curseur, "curseur_suivant": curseur_suivant})
+
+@routeur.get("/serveurs/{serveur_id}/logs")
+def lister_logs(request: Request, serveur_id: int, curseur: Optional[str] = None, limite: int = LOGS_PAR_PAGE, sorties: bool = False, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    return _reponse_conditionnelle(request, ("logs",), lambda: JSONResponse(_lister_logs(db, serveur_id, curseur, limite, sorties)))
+
+def _lister_logs(db, serveur_id, curseur, limite, sorties):
+    logs, curseur_suivant = _page_logs(db, serveur_id, curseur, limite, sorties)
+    elements = []
+    for log in logs:
+        element = {
+            "id": log.id,
+            "date_execution": log.date_execution.isoformat(),
+            "script": log.script,
+            "origine": log.origine,
+            "echec": log.echec,
+            "error": log.error,
+        }
+        if sorties:
+            element["stdout"] = log.stdout
+            element["stderr"] = log.stderr
+        elements.append(element)
+    return {"logs": elements, "curseur_suivant": curseur_suivant}
+
+# --- Comparaison des résultats d'un lot (même script sur plusieurs serveurs), groupés par empreinte ---
+@routeur.get("/lots")
+def lister_lots(request: Request, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    return _reponse_conditionnelle(request, ("logs",), lambda: JSONResponse(lots_recents(db)))
+
+@routeur.get("/lots/{lot_id}")
+def comparer_lot(request: Request, lot_id: str, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    def construire():
+        resultat = agreger_lot(db, lot_id)
+        if resultat is None:
+            raise HTTPException(status_code=404, detail="Lot inconnu")
+        return JSONResponse(resultat)
+    return _reponse_conditionnelle(request, ("logs",), construire)
+
+@routeur.get("/lots_html")
+def lots_html(request: Request, lot_id: Optional[str] = None, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    lot = agreger_lot(db, lot_id) if lot_id else None
+    if lot_id and lot is None:
+        set_notification(request, "Lot inconnu.", "error")
+    lots = lots_recents(db) if lot is None else []
+    return templates.TemplateResponse("lots.html", {"request": request, "lot": lot, "lots": lots, "notification": pop_notification(request)})
+
+@routeur.get("/logs/{log_id}/sortie")
+def sortie_log(log_id: int, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    log = db.query(LogExecution).filter(LogExecution.id == log_id).first()
+    if not log:
+        raise HTTPException(status_code=404, detail="Log non trouvé")
+    return {"stdout": log.stdout or "", "stderr": log.stderr or ""}
+
+# --- Recherche plein texte dans les logs (index FTS5, voir recherche.py) ---
+def _date_filtre(valeur):
+    if not valeur:
+        return None
+    try:
+        return datetime.strptime(valeur, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Date invalide (attendu AAAA-MM-JJ) : " + valeur)
+
+@routeur.get("/recherche")
+def recherche_logs(q: str, serveur_id: Optional[int] = None, debut: Optional[str] = None, fin: Optional[str] = None, origine: Optional[str] = None, avant: Optional[int] = None, limite: int = RECHERCHE_PAR_PAGE, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    resultats, suivant = rechercher(db, q, serveur_id, _date_filtre(debut), _date_filtre(fin), origine, avant, limite)
+    return {"resultats": resultats, "curseur_suivant": suivant}
+
+@routeur.get("/recherche_html")
+def recherche_html(request: Request, q: str = "", serveur_id: str = "", debut: str = "", fin: str = "", origine: str = "", avant: Optional[int] = None, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    # Champs de formulaire : une valeur vide signifie « tous »
+    serveur_id = int(serveur_id) if serveur_id.isdigit() else None
+    resultats, suivant = rechercher(db, q, serveur_id, _date_filtre(debut), _date_filtre(fin), origine or None, avant)
+    serveurs = db.query(Serveur).order_by(Serveur.nom).all()
+    filtres = {"q": q, "serveur_id": serveur_id or "", "debut": debut, "fin": fin, "origine": origine}
+    return templates.TemplateResponse("recherche.html", {"request": request, "serveurs": serveurs, "resultats": resultats, "filtres": filtres, "avant": avant, "curseur_suivant": suivant})
+
+@routeur.get("/dashboard_html")
 def dashboard_html(request: Request, db: Session = Depends(get_db), user: str = Depends(require_login)):
+    # Agrégats recalculés quand un serveur ou un log change (et au plus tard après COLLECTEUR_CACHE_TTL)
+    return _page_en_cache(request, "dashboard.html", ("serveurs", "logs"), lambda: _agregats_dashboard(db))
+
+def _agregats_dashboard(db):
     nb_serveurs = db.query(Serveur).count()
-    nb_exec = db.query(LogExecution).count()
-    derniers_logs = db.query(LogExecution).order_by(LogExecution.date_execution.desc()).limit(5).all()
-    # Calcul du nombre d'échecs automatiques récents
-    nb_alertes = db.query(LogExecution).filter(LogExecution.error != None, LogExecution.error.like("%automatique%"), LogExecution.date_execution >= datetime.utcnow()-timedelta(days=1)).count()
+    # Comptage complet de la table : rafraîchi au plus une fois par COLLECTEUR_CACHE_TTL, et non à chaque log
+    # écrit (chaque insertion change la version du domaine « logs » et recalcule le reste de la page)
+    nb_exec = cache.obtenir(("compte", "logs"), (), lambda: db.query(func.count(LogExecution.id)).scalar())
+    derniers_logs = db.query(LogExecution).options(joinedload(LogExecution.serveur)).order_by(LogExecution.date_execution.desc()).limit(5).all()
+    # Calcul du nombre d'échecs automatiques récents (index ix_logs_origine_echec_date)
+    nb_alertes = db.query(LogExecution).filter(LogExecution.origine == "automatique", LogExecution.echec == True, LogExecution.date_execution >= datetime.utcnow()-timedelta(days=1)).count()
     notif_alerte = None
     if nb_alertes > 0:
         notif_alerte = f"{nb_alertes} tâche(s) planifiée(s) ont échoué ces dernières 24h."
-    return templates.TemplateResponse("dashboard.html", {"request": request, "nb_serveurs": nb_serveurs, "nb_exec": nb_exec, "derniers_logs": derniers_logs, "nb_alertes": nb_alertes, "notif_alerte": notif_alerte})
+    return {"nb_serveurs": nb_serveurs, "nb_exec": nb_exec, "derniers_logs": derniers_logs, "nb_alertes": nb_alertes, "notif_alerte": notif_alerte}
 
-@app.get("/taches_html")
+@routeur.get("/taches_html")
 def taches_html(request: Request, db: Session = Depends(get_db), user: str = Depends(require_login)):
-    taches = db.query(TachePlanifiee).order_by(TachePlanifiee.date_execution).all()
-    serveurs = db.query(Serveur).all()
-    notif = pop_notification(request)
-    return templates.TemplateResponse("taches.html", {"request": request, "taches": taches, "serveurs": serveurs, "notification": notif})
+    def contexte():
+        taches = db.query(TachePlanifiee).options(joinedload(TachePlanifiee.serveur), joinedload(TachePlanifiee.groupe)).order_by(TachePlanifiee.date_execution).all()
+        groupes = db.query(Groupe).order_by(Groupe.nom).all()
+        return {"taches": taches, "serveurs": _serveurs_en_cache(), "groupes": groupes}
+    return _page_en_cache(request, "taches.html", ("taches", "serveurs"), contexte)
 
-@app.post("/taches_html")
+@routeur.post("/taches_html")
 def ajouter_tache_html(
-    serveur_id: int = Form(...),
+    cible: str = Form(...),
     script: str = Form(...),
     date_execution: str = Form(...),
     recurrence: str = Form(None),
+    recurrence_personnalisee: str = Form(None),
+    politique_retard: str = Form(POLITIQUE_DEFAUT),
+    gigue: int = Form(0),
+    priorite: str = Form(PRIORITE_DEFAUT),
     db: Session = Depends(get_db),
     user: str = Depends(require_login),
     request: Request = None
@@ -319,22 +685,42 @@ def ajouter_tache_html(
     from datetime import datetime
     try:
         date_exec = datetime.strptime(date_execution, "%Y-%m-%dT%H:%M")
+        if recurrence == "personnalisee":
+            recurrence = (recurrence_personnalisee or "").strip()
+        # Expression cron ou intervalle invalide : refusée avant l'enregistrement
+        analyser_recurrence(recurrence)
+        if politique_retard not in POLITIQUES:
+            raise ValueError(f"Politique de retard inconnue : {politique_retard}")
+        if priorite not in PRIORITES:
+            raise ValueError(f"Priorité inconnue : {priorite}")
+        # « serveur:<id> » ou « groupe:<id> » (tous les serveurs du groupe à chaque exécution)
+        type_cible, _, cible_id = cible.partition(":")
+        if type_cible not in ("serveur", "groupe"):
+            raise ValueError(f"Cible inconnue : {cible}")
         tache = TachePlanifiee(
-            serveur_id=serveur_id,
+            serveur_id=int(cible_id) if type_cible == "serveur" else None,
+            groupe_id=int(cible_id) if type_cible == "groupe" else None,
             script=script,
             date_execution=date_exec,
             recurrence=recurrence or None,
+            politique_retard=politique_retard,
+            gigue=max(0, gigue),
+            priorite=priorite,
             statut="active"
         )
         db.add(tache)
+        db.flush()
+        # Étalement : chaque tâche garde le même décalage (dérivé de son id) à toutes ses échéances
+        tache.date_execution += decalage(tache.id, tache.gigue)
         db.commit()
+        synchroniser_tache(tache)
         set_notification(request, "Tâche planifiée ajoutée.", "success")
     except Exception as e:
         db.rollback()
         set_notification(request, f"Erreur : {e}", "error")
     return RedirectResponse(url="/taches_html", status_code=303)
 
-@app.post("/supprimer_tache_html")
+@routeur.post("/supprimer_tache_html")
 def supprimer_tache_html(tache_id: int = Form(...), db: Session = Depends(get_db), user: str = Depends(require_login), request: Request = None):
     tache = db.query(TachePlanifiee).filter(TachePlanifiee.id == tache_id).first()
     if tache:
@@ -345,79 +731,63 @@ def supprimer_tache_html(tache_id: int = Form(...), db: Session = Depends(get_db
         set_notification(request, "Tâche introuvable.", "error")
     return RedirectResponse(url="/taches_html", status_code=303)
 
-# --- SCHEDULER POUR LES TÂCHES PLANIFIÉES ---
-scheduler = BackgroundScheduler()
-
-def executer_tache_planifiee(tache_id):
-    db = SessionLocal()
-    tache = db.query(TachePlanifiee).filter(TachePlanifiee.id == tache_id).first()
-    if not tache or tache.statut != "active":
-        db.close()
-        return
-    serveur = db.query(Serveur).filter(Serveur.id == tache.serveur_id).first()
-    log = LogExecution(serveur_id=tache.serveur_id, script=tache.script, error=None)
-    try:
-        log.origine = "automatique"
-    except Exception:
-        pass
-    if serveur:
-        import paramiko
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        try:
-            connect_args = {
-                "hostname": serveur.adresse_ip,
-                "port": serveur.port_ssh,
-                "username": serveur.utilisateur_ssh,
-            }
-            if serveur.chemin_cle_privee:
-                connect_args["key_filename"] = serveur.chemin_cle_privee
-            elif serveur.mot_de_passe:
-                connect_args["password"] = serveur.mot_de_passe
-            ssh.connect(**connect_args)
-            stdin, stdout, stderr = ssh.exec_command(tache.script)
-            sortie = stdout.read().decode()
-            erreur = stderr.read().decode()
-            log.stdout = sortie
-            log.stderr = erreur
-            tache.dernier_run = datetime.utcnow()
-            db.commit()
-            ssh.close()
-        except Exception as e:
-            log.error = f"Erreur automatique : {str(e)}"
-            tache.dernier_run = datetime.utcnow()
-            tache.statut = "error"
-            db.commit()
-    db.add(log)
-    db.commit()
-    # Gérer la récurrence
-    if tache.recurrence == "daily":
-        tache.date_execution += timedelta(days=1)
-        tache.statut = "active"
-        db.commit()
-    elif tache.recurrence == "weekly":
-        tache.date_execution += timedelta(weeks=1)
-        tache.statut = "active"
-        db.commit()
-    else:
-        tache.statut = "done"
-        db.commit()
-    db.close()
-
-def verifier_et_planifier_taches():
-    db = SessionLocal()
-    now = datetime.utcnow()
-    taches = db.query(TachePlanifiee).filter(TachePlanifiee.statut == "active").all()
-    for t in taches:
-        if t.date_execution <= now:
-            # Planifie l'exécution immédiate si pas déjà planifiée
-            scheduler.add_job(executer_tache_planifiee, args=[t.id], trigger=DateTrigger(run_date=now))
-    db.close()
-
-scheduler.add_job(verifier_et_planifier_taches, IntervalTrigger(minutes=1))
-scheduler.start()
-
-@app.post("/afficher_mot_de_passe/{serveur_id}")
+# --- Démarrage et arrêt des services (cycle de vie de l'application, rien à l'import du module) ---
+def _etape(nom, fonction, *args, **kwargs):
+    debut = time.perf_counter()
+    fonction(*args, **kwargs)
+    metrics.demarrage.set(round(time.perf_counter() - debut, 4), etape=nom)
+
+def demarrer_services(mode=MODE):
+    """Base (création et migration du schéma), index de recherche, planificateur et tâches de maintenance."""
+    debut = time.perf_counter()
+    _etape("base", init_db)
+    _etape("recherche", initialiser_recherche)
+    ecrivain_logs.demarrer()
+    # Fermeture des connexions SSH inactives du pool
+    scheduler.add_job(pool_ssh.evincer_inactifs, IntervalTrigger(minutes=1), id="evincer_ssh", replace_existing=True)
+    # Santé de la flotte, gardée chaude pour /sante
+    scheduler.add_job(cache_sante.rafraichir, IntervalTrigger(seconds=SANTE_INTERVALLE), next_run_time=datetime.now(),
+                      id="sante", replace_existing=True)
+    if mode == "tout":
+        # Rétention des logs d'exécution
+        scheduler.add_job(purger_logs, IntervalTrigger(hours=1), id="purge_logs", replace_existing=True)
+        # Rattrapage de l'index de recherche (base existante, logs insérés hors ORM), une fois au démarrage
+        scheduler.add_job(indexer_manquants, id="indexation", replace_existing=True)
+    # En mode web, les tâches planifiées sont exécutées par des processus `python worker.py`
+    _etape("planificateur", demarrer_planificateur, worker=mode == "tout")
+    metrics.demarrage.set(round(time.perf_counter() - debut, 4), etape="services")
+
+def arreter_services():
+    # Les tâches en cours se terminent, puis les logs encore en file sont écrits et les connexions SSH fermées
+    arreter_planificateur()
+    ecrivain_logs.arreter()
+    pool_ssh.fermer()
+
+@routeur.get("/ssh_pool/stats")
+def statistiques_pool_ssh():
+    return pool_ssh.statistiques()
+
+@routeur.get("/cache/stats")
+def statistiques_cache():
+    return cache.statistiques()
+
+@routeur.get("/execution/stats")
+def statistiques_execution():
+    return dict(moteur.statistiques(), admission=admission.statistiques())
+
+@routeur.get("/execution/file")
+def file_execution(user: str = Depends(require_login)):
+    return admission.etat()
+
+@routeur.get("/planificateur/stats")
+def statistiques_planificateur():
+    return dict(travailleur.statistiques(), mode=MODE)
+
+@routeur.get("/metrics", response_class=PlainTextResponse)
+def metriques():
+    return PlainTextResponse(metrics.exposer(), media_type="text/plain; version=0.0.4")
+
+@routeur.post("/afficher_mot_de_passe/{serveur_id}")
 def afficher_mot_de_passe(serveur_id: int, password: str = Form(...), db: Session = Depends(get_db), request: Request = None):
     import hashlib
     password_hash = hashlib.sha256(password.encode()).hexdigest()
@@ -428,7 +798,11 @@ def afficher_mot_de_passe(serveur_id: int, password: str = Form(...), db: Sessio
         return JSONResponse({"success": False, "message": "Serveur introuvable."}, status_code=404)
     return {"success": True, "mot_de_passe": serveur.mot_de_passe or ""}
 
-@app.get("/ping/{serveur_id}")
+@routeur.get("/sante")
+def sante_flotte():
+    return cache_sante.etat()
+
+@routeur.get("/ping/{serveur_id}")
 def ping_serveur(serveur_id: int, db: Session = Depends(get_db)):
     import platform
     serveur = db.query(Serveur).filter(Serveur.id == serveur_id).first()
@@ -449,4 +823,28 @@ def ping_serveur(serveur_id: int, db: Session = Depends(get_db)):
         else:
             return {"success": False, "message": "Timeout ou hôte injoignable", "latency_ms": None, "ip": ip, "error": output.strip()}
     except Exception as e:
-        return {"success": False, "message": "Erreur lors du ping", "latency_ms": None, "ip": ip, "error": str(e)} 
\ No newline at end of file
+        return {"success": False, "message": "Erreur lors du ping", "latency_ms": None, "ip": ip, "error": str(e)} 
+
+def creer_app(mode=MODE):
+    """Construit l'application ; les services démarrent à son lancement (lifespan) et s'arrêtent avec elle.
+
+    `uvicorn main:app` utilise l'instance du module, `uvicorn --factory main:creer_app` en crée une.
+    """
+    @asynccontextmanager
+    async def cycle_de_vie(application):
+        demarrer_services(mode)
+        try:
+            yield
+        finally:
+            arreter_services()
+
+    application = FastAPI(lifespan=cycle_de_vie)
+    application.mount("/static", StaticFiles(directory="static"), name="static")
+    application.include_router(routeur)
+    application.add_middleware(SessionMiddleware, secret_key="supersecretkey123")
+    # Ajouté en dernier : englobe les autres middlewares dans la mesure de latence
+    application.add_middleware(metrics.MiddlewareMetriques)
+    return application
+
+app = creer_app()
+metrics.demarrage.set(round(time.perf_counter() - _DEBUT_IMPORT, 4), etape="import")
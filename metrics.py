@@ -0,0 +1,201 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Métriques au format texte Prometheus, sans dépendance externe ---
+# Coût d'une observation : un verrou, une recherche dichotomique et quelques additions.
+METRIQUES_ACTIVES = os.environ.get("COLLECTEUR_METRIQUES", "1") != "0"
+BUCKETS_DEFAUT = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_registre = []
+
+
+def _echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquettes(noms, valeurs, extra=""):
+    paires = [f'{n}="{_echapper(v)}"' for n, v in zip(noms, valeurs)]
+    if extra:
+        paires.append(extra)
+    return "{" + ",".join(paires) + "}" if paires else ""
+
+
+def _nombre(valeur):
+    if valeur == float("inf"):
+        return "+Inf"
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+class _Metrique:
+    type = None
+
+    def __init__(self, nom, aide, etiquettes=(), fonction=None):
+        """`fonction` (optionnelle) : valeur lue à l'exposition au lieu d'être tenue à jour."""
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        self.fonction = fonction
+        self._valeurs = {}
+        self._lock = threading.Lock()
+        _registre.append(self)
+
+    def _cle(self, etiquettes):
+        return tuple(etiquettes.get(n, "") for n in self.etiquettes)
+
+    def _lignes(self):
+        if self.fonction is not None:
+            yield f"{self.nom} {_nombre(self.fonction())}"
+            return
+        with self._lock:
+            valeurs = dict(self._valeurs)
+        for cle, valeur in sorted(valeurs.items()):
+            yield f"{self.nom}{_etiquettes(self.etiquettes, cle)} {_nombre(valeur)}"
+
+    def exposer(self):
+        return "\n".join([f"# HELP {self.nom} {self.aide}", f"# TYPE {self.nom} {self.type}", *self._lignes()])
+
+
+class Compteur(_Metrique):
+    type = "counter"
+
+    def inc(self, valeur=1, **etiquettes):
+        if not METRIQUES_ACTIVES:
+            return
+        cle = self._cle(etiquettes)
+        with self._lock:
+            self._valeurs[cle] = self._valeurs.get(cle, 0) + valeur
+
+
+class Jauge(_Metrique):
+    type = "gauge"
+
+    def set(self, valeur, **etiquettes):
+        with self._lock:
+            self._valeurs[self._cle(etiquettes)] = valeur
+
+    def inc(self, valeur=1, **etiquettes):
+        cle = self._cle(etiquettes)
+        with self._lock:
+            self._valeurs[cle] = self._valeurs.get(cle, 0) + valeur
+
+    def dec(self, valeur=1, **etiquettes):
+        self.inc(-valeur, **etiquettes)
+
+
+class Histogramme(_Metrique):
+    type = "histogram"
+
+    def __init__(self, nom, aide, etiquettes=(), buckets=BUCKETS_DEFAUT):
+        super().__init__(nom, aide, etiquettes)
+        self.buckets = tuple(sorted(buckets))
+
+    def observer(self, valeur, **etiquettes):
+        if not METRIQUES_ACTIVES:
+            return
+        cle = self._cle(etiquettes)
+        rang = bisect.bisect_left(self.buckets, valeur)
+        with self._lock:
+            serie = self._valeurs.get(cle)
+            if serie is None:
+                # [compte par bucket (non cumulé), +Inf], somme, nombre
+                serie = self._valeurs[cle] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][rang] += 1
+            serie[1] += valeur
+            serie[2] += 1
+
+    @contextmanager
+    def chrono(self, **etiquettes):
+        """Mesure la durée du bloc ; l'étiquette `statut` passe à "erreur" s'il lève."""
+        debut = time.perf_counter()
+        statut = "ok"
+        try:
+            yield
+        except BaseException:
+            statut = "erreur"
+            raise
+        finally:
+            if "statut" in self.etiquettes:
+                etiquettes["statut"] = statut
+            self.observer(time.perf_counter() - debut, **etiquettes)
+
+    def _lignes(self):
+        with self._lock:
+            series = {cle: (list(s[0]), s[1], s[2]) for cle, s in self._valeurs.items()}
+        for cle, (comptes, somme, nombre) in sorted(series.items()):
+            cumul = 0
+            for borne, compte in zip(self.buckets + (float("inf"),), comptes):
+                cumul += compte
+                le = 'le="%s"' % _nombre(borne)
+                yield f"{self.nom}_bucket{_etiquettes(self.etiquettes, cle, le)} {cumul}"
+            yield f"{self.nom}_sum{_etiquettes(self.etiquettes, cle)} {_nombre(somme)}"
+            yield f"{self.nom}_count{_etiquettes(self.etiquettes, cle)} {nombre}"
+
+
+def exposer():
+    """Toutes les métriques enregistrées, au format d'exposition texte Prometheus 0.0.4."""
+    return "\n".join(m.exposer() for m in _registre) + "\n"
+
+
+# --- Métriques de l'application ---
+ssh_handshake = Histogramme(
+    "collecteur_ssh_handshake_secondes", "Durée d'ouverture d'une connexion SSH (TCP + poignée de main + authentification)",
+    ("chemin", "statut"))
+ssh_execution = Histogramme(
+    "collecteur_ssh_execution_secondes", "Durée d'exécution d'une commande sur un canal SSH",
+    ("chemin", "statut"))
+execution_attente = Histogramme(
+    "collecteur_execution_attente_secondes", "Attente d'un worker du moteur d'exécution avant démarrage")
+admission_attente = Histogramme(
+    "collecteur_admission_attente_secondes", "Attente en file d'admission avant le démarrage d'une exécution SSH",
+    ("origine",))
+admission_refus = Compteur(
+    "collecteur_admission_refus_total", "Exécutions refusées faute de place en file d'admission (429)")
+planificateur_retard = Histogramme(
+    "collecteur_planificateur_retard_secondes", "Retard de déclenchement d'une tâche planifiée (début - échéance)")
+planificateur_taches = Compteur(
+    "collecteur_planificateur_taches_total", "Occurrences de tâches planifiées traitées", ("statut",))
+planificateur_en_cours = Jauge(
+    "collecteur_planificateur_en_cours", "Tâches planifiées en cours d'exécution")
+db_requete = Histogramme(
+    "collecteur_db_requete_secondes", "Durée des requêtes SQL", ("operation",))
+db_connexion_detenue = Histogramme(
+    "collecteur_db_connexion_detenue_secondes", "Durée de détention d'une connexion du pool SQLAlchemy")
+cache_requetes = Compteur(
+    "collecteur_cache_requetes_total", "Lectures du cache des pages et listes, par résultat (hit, miss)", ("resultat",))
+ecrivain_lot = Histogramme(
+    "collecteur_ecrivain_lot_taille", "Logs d'exécution écrits par transaction groupée",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+demarrage = Jauge(
+    "collecteur_demarrage_secondes", "Durée du démarrage par étape (import, base, recherche, planificateur, services)",
+    ("etape",))
+http_requete = Histogramme(
+    "collecteur_http_requete_secondes", "Latence des requêtes HTTP par route", ("methode", "route", "code"))
+
+
+class MiddlewareMetriques:
+    """Middleware ASGI : latence par route (gabarit de chemin, pas l'URL, pour borner les séries)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRIQUES_ACTIVES:
+            await self.app(scope, receive, send)
+            return
+        debut = time.perf_counter()
+        code = [500]
+
+        async def envoyer(message):
+            if message["type"] == "http.response.start":
+                code[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, envoyer)
+        finally:
+            route = scope.get("route")
+            http_requete.observer(time.perf_counter() - debut, methode=scope["method"],
+                                  route=getattr(route, "path", "inconnue"), code=code[0])
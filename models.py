@@ -1,10 +1,34 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, LargeBinary, Boolean, Index, Table, false
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred, validates
+from sqlalchemy.types import TypeDecorator
 import datetime
+from stockage_logs import tronquer, compresser, decompresser, empreinte
 
 Base = declarative_base()
 
+class SortieCompressee(TypeDecorator):
+    """Texte tronqué (début + fin) puis compressé en zlib ; relit aussi les anciennes lignes en clair."""
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compresser(tronquer(value))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decompresser(value)
+
+# Appartenance des serveurs aux groupes (un serveur peut être dans plusieurs groupes)
+serveurs_groupes = Table(
+    "serveurs_groupes", Base.metadata,
+    Column("serveur_id", Integer, ForeignKey("serveurs.id", ondelete="CASCADE"), primary_key=True),
+    Column("groupe_id", Integer, ForeignKey("groupes.id", ondelete="CASCADE"), primary_key=True, index=True),
+)
+
 class Serveur(Base):
     __tablename__ = "serveurs"
     id = Column(Integer, primary_key=True, index=True)
@@ -14,25 +38,71 @@ class Serveur(Base):
     port_ssh = Column(Integer, default=22)
     chemin_cle_privee = Column(String, nullable=True)
     mot_de_passe = Column(String, nullable=True)
+    groupes = relationship("Groupe", secondary=serveurs_groupes, back_populates="serveurs")
+
+class Groupe(Base):
+    __tablename__ = "groupes"
+    id = Column(Integer, primary_key=True, index=True)
+    nom = Column(String, unique=True, index=True, nullable=False)
+    description = Column(Text, nullable=True)
+    serveurs = relationship("Serveur", secondary=serveurs_groupes, back_populates="groupes")
 
 class LogExecution(Base):
     __tablename__ = "logs_execution"
+    __table_args__ = (
+        # Historique par serveur (pagination par curseur date + id, id compris pour départager)
+        Index("ix_logs_serveur_date", "serveur_id", "date_execution", "id"),
+        # Alertes du tableau de bord : échecs automatiques récents
+        Index("ix_logs_origine_echec_date", "origine", "echec", "date_execution"),
+        # Comparaison des résultats d'une exécution sur plusieurs serveurs : regroupement par empreinte
+        Index("ix_logs_lot_empreinte", "lot_id", "empreinte_sortie"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     serveur_id = Column(Integer, ForeignKey("serveurs.id"))
-    date_execution = Column(DateTime, default=datetime.datetime.utcnow)
+    date_execution = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    origine = Column(String, default="manuelle", server_default="manuelle", nullable=False)  # manuelle, automatique
+    echec = Column(Boolean, default=False, server_default=false(), nullable=False)
     script = Column(Text)
-    stdout = Column(Text)
-    stderr = Column(Text)
+    # Sorties chargées uniquement à l'accès (liste des logs sans décompression)
+    stdout = deferred(Column(SortieCompressee))
+    stderr = deferred(Column(SortieCompressee))
     error = Column(Text)
+    # Empreinte de (stdout, stderr, error), calculée à l'écriture ; NULL pour les logs antérieurs
+    empreinte_sortie = Column(String(16), nullable=True)
+    # Identifiant commun aux logs d'une même exécution sur plusieurs serveurs (fan-out, tâche de groupe)
+    lot_id = Column(String(32), nullable=True)
     serveur = relationship("Serveur")
 
+    @validates("stdout", "stderr", "error")
+    def _maj_resultat(self, key, value):
+        if key == "error":
+            self.echec = value is not None
+        # Valeurs déjà affectées uniquement (pas de chargement des sorties différées)
+        resultat = {k: self.__dict__.get(k) for k in ("stdout", "stderr", "error")}
+        resultat[key] = value
+        self.empreinte_sortie = empreinte(**resultat)
+        return value
+
 class TachePlanifiee(Base):
     __tablename__ = "taches_planifiees"
+    __table_args__ = (
+        # Réclamation des tâches échues par les workers
+        Index("ix_taches_statut_date", "statut", "date_execution"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     serveur_id = Column(Integer, ForeignKey("serveurs.id"))
+    # Cible alternative : tous les serveurs du groupe au moment de l'exécution
+    groupe_id = Column(Integer, ForeignKey("groupes.id"), nullable=True)
     script = Column(Text)
     date_execution = Column(DateTime)  # Prochaine exécution
-    recurrence = Column(String, nullable=True)  # ex: 'daily', 'weekly', 'none'
+    recurrence = Column(String, nullable=True)  # ex: 'daily', 'weekly', '30m', '*/15 * * * *' (voir recurrence.py)
+    politique_retard = Column(String, default="regrouper", server_default="regrouper", nullable=False)  # rattraper, ignorer
+    gigue = Column(Integer, default=0, server_default="0", nullable=False)  # secondes d'étalement max
+    priorite = Column(String, default="normale", server_default="normale", nullable=False)  # haute, basse (voir admission.py)
     statut = Column(String, default="active")  # active, done, error, etc.
     dernier_run = Column(DateTime, nullable=True)
-    serveur = relationship("Serveur") 
\ No newline at end of file
+    # Bail du worker qui exécute la tâche (statut en_cours), prolongé tant qu'il est vivant
+    bail_proprietaire = Column(String, nullable=True)
+    bail_expire = Column(DateTime, nullable=True)
+    serveur = relationship("Serveur")
+    groupe = relationship("Groupe") 
\ No newline at end of file
@@ -0,0 +1,278 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent import futures
+from datetime import datetime, timedelta, timezone
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import and_, func, or_, select, update
+
+import metrics
+import recurrence
+from admission import admission
+from comparaison import nouveau_lot
+from database import SessionLocal
+from ecrivain_logs import ecrivain_logs
+from execution import EXECUTION_TIMEOUT
+from models import Groupe, Serveur, LogExecution, TachePlanifiee
+from ssh_pool import pool_ssh
+
+# --- Exécution des tâches planifiées : workers à bail sur la base partagée ---
+# Chaque worker (application en mode « tout » ou processus `python worker.py`) réclame les tâches échues
+# par un UPDATE conditionnel qui lui attribue un bail ; le bail est prolongé tant que le worker vit
+# et une tâche dont le bail a expiré (worker tombé) est reprise par un autre.
+# Les dates des tâches sont en UTC naïf (datetime.utcnow).
+MODE = os.environ.get("COLLECTEUR_MODE", "tout")  # tout : web + worker, web : web seul
+PLANIFICATEUR_WORKERS = int(os.environ.get("COLLECTEUR_PLANIFICATEUR_WORKERS", "10"))
+PLANIFICATEUR_INTERVALLE = float(os.environ.get("COLLECTEUR_PLANIFICATEUR_INTERVALLE", "1"))  # secondes
+PLANIFICATEUR_BAIL = float(os.environ.get("COLLECTEUR_PLANIFICATEUR_BAIL", "60"))  # secondes
+PLANIFICATEUR_CONCURRENCE_GROUPE = int(os.environ.get("COLLECTEUR_PLANIFICATEUR_CONCURRENCE_GROUPE", "16"))  # par tâche de groupe
+
+logger = logging.getLogger("collecteur.planificateur")
+
+# Tâches de maintenance (rétention, éviction du pool SSH, santé), propres à chaque processus
+scheduler = BackgroundScheduler(
+    job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": None},
+    timezone=timezone.utc,
+)
+
+
+def _echues(maintenant):
+    return or_(
+        and_(TachePlanifiee.statut == "active", TachePlanifiee.date_execution <= maintenant),
+        # Bail expiré : le worker qui l'exécutait est arrêté ou bloqué
+        and_(TachePlanifiee.statut == "en_cours",
+             or_(TachePlanifiee.bail_expire.is_(None), TachePlanifiee.bail_expire < maintenant)),
+    )
+
+
+class Travailleur:
+    def __init__(self, capacite=PLANIFICATEUR_WORKERS, intervalle=PLANIFICATEUR_INTERVALLE, bail=PLANIFICATEUR_BAIL):
+        self.identifiant = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.capacite = capacite
+        self.intervalle = intervalle
+        self.bail = bail
+        self._en_cours = set()
+        self._lock = threading.Lock()
+        self._reveil = threading.Event()
+        self._arret = threading.Event()
+        self._thread = None
+        self._pool = None
+        self._stats = {"reclamees": 0}
+
+    def demarrer(self):
+        self._arret.clear()
+        self._pool = futures.ThreadPoolExecutor(self.capacite, thread_name_prefix="tache")
+        self._thread = threading.Thread(target=self._boucle, name="travailleur", daemon=True)
+        self._thread.start()
+
+    def reveiller(self):
+        """Relance une réclamation sans attendre le prochain tour (tâche ajoutée, place libérée)."""
+        self._reveil.set()
+
+    def _boucle(self):
+        prochain_battement = datetime.min
+        while not self._arret.is_set():
+            attente = self.intervalle
+            try:
+                if datetime.utcnow() >= prochain_battement:
+                    self._prolonger_baux()
+                    prochain_battement = datetime.utcnow() + timedelta(seconds=self.bail / 3)
+                libres = self.capacite - len(self._en_cours)
+                if libres > 0:
+                    reclamees = self._reclamer(libres)
+                    for tache_id, echeance in reclamees:
+                        with self._lock:
+                            self._en_cours.add(tache_id)
+                        self._pool.submit(self._executer, tache_id, echeance)
+                    if len(reclamees) < libres:
+                        attente = self._attente_prochaine()
+            except Exception:
+                logger.exception("Réclamation des tâches planifiées impossible")
+            self._reveil.wait(attente)
+            self._reveil.clear()
+
+    def _reclamer(self, nb):
+        """Attribue au worker au plus `nb` tâches échues ; retourne [(id, échéance)]."""
+        maintenant = datetime.utcnow()
+        # SKIP LOCKED (PostgreSQL) : deux workers ne se disputent pas les mêmes lignes ; SQLite sérialise les écritures
+        candidates = select(TachePlanifiee.id).where(_echues(maintenant)) \
+            .order_by(TachePlanifiee.date_execution).limit(nb).with_for_update(skip_locked=True)
+        db = SessionLocal()
+        try:
+            ids = db.execute(candidates).scalars().all()
+            if not ids:
+                # Rien d'échu : pas d'UPDATE (ni d'invalidation du cache des tâches à chaque tour)
+                return []
+            lignes = db.execute(
+                update(TachePlanifiee)
+                .where(TachePlanifiee.id.in_(ids), _echues(maintenant))
+                .values(statut="en_cours", bail_proprietaire=self.identifiant,
+                        bail_expire=maintenant + timedelta(seconds=self.bail))
+                .returning(TachePlanifiee.id, TachePlanifiee.date_execution)
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+        finally:
+            db.close()
+        self._stats["reclamees"] += len(lignes)
+        return [(ligne.id, ligne.date_execution) for ligne in lignes]
+
+    def _prolonger_baux(self):
+        with self._lock:
+            ids = list(self._en_cours)
+        if not ids:
+            return
+        db = SessionLocal()
+        try:
+            db.query(TachePlanifiee).filter(
+                TachePlanifiee.id.in_(ids),
+                TachePlanifiee.statut == "en_cours",
+                TachePlanifiee.bail_proprietaire == self.identifiant,
+            ).update({TachePlanifiee.bail_expire: datetime.utcnow() + timedelta(seconds=self.bail)},
+                     synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _attente_prochaine(self):
+        """Secondes avant la prochaine échéance connue, bornées par l'intervalle de réclamation."""
+        db = SessionLocal()
+        try:
+            prochaine = db.query(func.min(TachePlanifiee.date_execution)) \
+                .filter(TachePlanifiee.statut == "active").scalar()
+        finally:
+            db.close()
+        if prochaine is None:
+            return self.intervalle
+        return max(0, min(self.intervalle, (prochaine - datetime.utcnow()).total_seconds()))
+
+    def _executer(self, tache_id, echeance):
+        try:
+            executer_tache_planifiee(tache_id, echeance)
+        except Exception:
+            logger.exception("Tâche planifiée %s en échec", tache_id)
+        finally:
+            with self._lock:
+                self._en_cours.discard(tache_id)
+            self._reveil.set()
+
+    def arreter(self):
+        """Ne réclame plus rien et attend la fin des tâches en cours."""
+        self._arret.set()
+        self._reveil.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def statistiques(self):
+        return dict(self._stats, identifiant=self.identifiant, capacite=self.capacite, en_cours=len(self._en_cours))
+
+
+travailleur = Travailleur()
+
+
+def synchroniser_tache(tache):
+    """Signale une tâche ajoutée ou modifiée au worker local (les autres la trouvent à leur prochain tour)."""
+    travailleur.reveiller()
+
+
+def _executer_sur(serveur, script, priorite, depart=None):
+    log = LogExecution(serveur_id=serveur.id, script=script, error=None)
+    log.origine = "automatique"
+    if depart is not None:
+        # Étalement des membres d'un groupe ; un arrêt du worker interrompt l'attente
+        travailleur._arret.wait(max(0.0, depart - time.monotonic()))
+    try:
+        # Attend son tour auprès du contrôleur d'admission (limites par hôte et globale, file équitable)
+        with admission.admettre(serveur, "automatique", priorite):
+            # Sans timeout, une commande bloquée garderait la tâche (bail prolongé) et sa place indéfiniment
+            sortie, erreur = pool_ssh.executer(serveur, script, timeout=EXECUTION_TIMEOUT, chemin="planificateur")
+        log.stdout = sortie
+        log.stderr = erreur
+    except TimeoutError:
+        log.error = f"Erreur automatique : aucune sortie depuis {EXECUTION_TIMEOUT:g} s (timeout)"
+    except Exception as e:
+        log.error = f"Erreur automatique : {str(e)}"
+    return log
+
+
+def executer_tache_planifiee(tache_id, echeance):
+    """Exécute une occurrence déjà réclamée par le worker, puis rend la tâche (nouvelle échéance, bail levé)."""
+    db = SessionLocal()
+    metrics.planificateur_retard.observer((datetime.utcnow() - echeance).total_seconds())
+    metrics.planificateur_en_cours.inc()
+    try:
+        tache = db.query(TachePlanifiee).filter(TachePlanifiee.id == tache_id).first()
+        if not tache:
+            return
+        maintenant = datetime.utcnow()
+        logs = []
+        if recurrence.doit_executer(tache, maintenant):
+            if tache.groupe_id is not None:
+                # Membres du groupe au moment de l'exécution
+                serveurs = db.query(Serveur).join(Serveur.groupes).filter(Groupe.id == tache.groupe_id) \
+                    .order_by(Serveur.id).all()
+            else:
+                serveurs = db.query(Serveur).filter(Serveur.id == tache.serveur_id).all()
+            if len(serveurs) > 1:
+                # Chaque serveur part à son propre décalage dans [0, gigue] : les sessions d'un grand groupe
+                # s'ouvrent sur toute la fenêtre, pas dans la même seconde. Soumis par ordre de départ,
+                # les threads du pool prennent toujours le prochain serveur à lancer.
+                debut = time.monotonic()
+                departs = {s.id: debut + recurrence.decalage(tache.id, tache.gigue, s.id).total_seconds() for s in serveurs}
+                serveurs.sort(key=lambda s: (departs[s.id], s.id))
+                with futures.ThreadPoolExecutor(min(len(serveurs), PLANIFICATEUR_CONCURRENCE_GROUPE),
+                                                thread_name_prefix="tache-groupe") as pool:
+                    logs = list(pool.map(lambda serveur: _executer_sur(serveur, tache.script, tache.priorite,
+                                                                       departs[serveur.id]), serveurs))
+            else:
+                logs = [_executer_sur(serveur, tache.script, tache.priorite) for serveur in serveurs]
+            if tache.groupe_id is not None:
+                # Une occurrence de tâche de groupe forme un lot, comparable serveur par serveur
+                lot_id = nouveau_lot()
+                for log in logs:
+                    log.lot_id = lot_id
+            if serveurs:
+                tache.dernier_run = datetime.utcnow()
+            metrics.planificateur_taches.inc(statut="ok" if serveurs and not any(l.error for l in logs) else "erreur")
+        else:
+            metrics.planificateur_taches.inc(statut="ignoree")
+        # Prochaine échéance calculée depuis le calendrier de la tâche (récurrence, gigue, politique de retard)
+        try:
+            suivante = recurrence.prochaine_echeance(tache, maintenant)
+            tache.statut = "active" if suivante is not None else "done"
+        except ValueError:
+            suivante = None
+            tache.statut = "error"
+        if suivante is not None:
+            tache.date_execution = suivante
+        # Logs et nouvel état de la tâche partent dans la même transaction groupée
+        ecrivain_logs.ajouter_logs(logs[:-1])
+        ecrivain_logs.ajouter(logs[-1] if logs else None, tache={"id": tache.id, "statut": tache.statut,
+                                          "date_execution": tache.date_execution, "dernier_run": tache.dernier_run,
+                                          "bail_proprietaire": None, "bail_expire": None})
+    finally:
+        metrics.planificateur_en_cours.dec()
+        db.close()
+
+
+def demarrer(worker=True):
+    """Démarre le scheduler de maintenance et, si `worker`, l'exécution des tâches planifiées."""
+    if not scheduler.running:
+        scheduler.start()
+    if worker and (travailleur._thread is None or not travailleur._thread.is_alive()):
+        travailleur.demarrer()
+
+
+def arreter():
+    # Les tâches en cours se terminent avant l'arrêt des jobs de maintenance
+    travailleur.arreter()
+    if scheduler.running:
+        scheduler.shutdown(wait=True)
+        # Le pool de threads arrêté ne resservirait pas : start() en recrée un au prochain démarrage
+        scheduler.remove_executor("default")
@@ -0,0 +1,240 @@
+import html
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+from sqlalchemy import column, event, inspect, or_, select, table, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import undefer
+
+from database import engine, SessionLocal
+from models import LogExecution, Serveur
+from stockage_logs import tronquer
+
+# --- Recherche plein texte dans les logs (SQLite FTS5) ---
+# Les sorties sont stockées compressées : l'index est alimenté depuis l'ORM (after_insert)
+# et non par des triggers SQL, avec le texte en clair de script, stdout, stderr et error.
+# La table FTS5 est sans contenu (content='') : elle ne garde que l'index, pas une seconde copie
+# non compressée des sorties. Les extraits surlignés sont construits en Python à partir des logs
+# de la page affichée, et une entrée se retire avec les valeurs qui ont été indexées.
+RECHERCHE_PAR_PAGE = int(os.environ.get("COLLECTEUR_RECHERCHE_PAR_PAGE", "50"))
+RECHERCHE_PAR_PAGE_MAX = 500
+RECHERCHE_LOT_INDEXATION = int(os.environ.get("COLLECTEUR_RECHERCHE_LOT_INDEXATION", "1000"))
+
+# Délimiteurs des termes trouvés dans les extraits, remplacés par <mark> après échappement HTML
+_DEBUT_SURLIGNE = "\x02"
+_FIN_SURLIGNE = "\x03"
+
+_fts = table("logs_fts", column("rowid"))
+_INSERTION = text("INSERT INTO logs_fts (rowid, script, stdout, stderr, error) VALUES (:id, :script, :stdout, :stderr, :error)")
+_SUPPRESSION = text("INSERT INTO logs_fts (logs_fts, rowid, script, stdout, stderr, error) "
+                    "VALUES ('delete', :id, :script, :stdout, :stderr, :error)")
+_CREATION = ("CREATE VIRTUAL TABLE logs_fts USING fts5(script, stdout, stderr, error, content='', "
+             "tokenize='unicode61 remove_diacritics 2')")
+EXTRAIT_CONTEXTE = 60  # caractères gardés avant le premier terme trouvé
+EXTRAIT_LONGUEUR = 200
+
+fts_actif = False
+
+
+def initialiser():
+    """Crée la table FTS5 si la base le permet ; sinon la recherche se replie sur LIKE (script et erreur)."""
+    global fts_actif
+    if engine.dialect.name != "sqlite":
+        fts_actif = False
+        return
+    try:
+        with engine.begin() as conn:
+            definition = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'logs_fts'")).scalar()
+            if definition is not None and "content=''" not in definition:
+                # Ancienne table qui stockait une copie des sorties : reconstruite par indexer_manquants
+                conn.execute(text("DROP TABLE logs_fts"))
+                definition = None
+            if definition is None:
+                conn.execute(text(_CREATION))
+        fts_actif = True
+    except OperationalError:
+        # SQLite compilé sans FTS5
+        fts_actif = False
+
+
+def _document(log, valeurs, brut=True):
+    """Valeurs indexées : celles que la base stocke (sorties tronquées comme par SortieCompressee)."""
+    return {
+        "id": log.id,
+        "script": valeurs.get("script"),
+        "stdout": tronquer(valeurs.get("stdout")) if brut else valeurs.get("stdout"),
+        "stderr": tronquer(valeurs.get("stderr")) if brut else valeurs.get("stderr"),
+        "error": valeurs.get("error"),
+    }
+
+
+def _valeurs(log):
+    return {"script": log.script, "stdout": log.stdout, "stderr": log.stderr, "error": log.error}
+
+
+@event.listens_for(LogExecution, "after_insert")
+def _indexer_log(mapper, connection, log):
+    if fts_actif:
+        # Attributs déjà présents uniquement : lire une colonne différée relancerait une requête en plein flush
+        connection.execute(_INSERTION, _document(log, inspect(log).dict))
+
+
+def desindexer(db, ids):
+    """Retire des logs de l'index (appelé avant leur suppression par la rétention).
+
+    Une table sans contenu ne sait pas quels termes retirer : ils sont relus depuis les logs.
+    """
+    if fts_actif and ids:
+        logs = db.query(LogExecution).options(undefer(LogExecution.stdout), undefer(LogExecution.stderr)) \
+            .filter(LogExecution.id.in_(ids)).all()
+        db.execute(_SUPPRESSION, [_document(log, _valeurs(log), brut=False) for log in logs])
+
+
+def indexer_manquants():
+    """Indexe les logs absents de l'index (base antérieure, insertions hors ORM), par lots."""
+    if not fts_actif:
+        return 0
+    db = SessionLocal()
+    indexes = 0
+    dernier = 0
+    try:
+        while True:
+            ids = [i for (i,) in db.execute(text(
+                "SELECT id FROM logs_execution WHERE id > :dernier AND id NOT IN (SELECT rowid FROM logs_fts) "
+                "ORDER BY id LIMIT :lot"), {"dernier": dernier, "lot": RECHERCHE_LOT_INDEXATION})]
+            if not ids:
+                break
+            logs = db.query(LogExecution).options(undefer(LogExecution.stdout), undefer(LogExecution.stderr)) \
+                .filter(LogExecution.id.in_(ids)).all()
+            db.execute(_INSERTION, [_document(log, _valeurs(log), brut=False) for log in logs])
+            db.commit()
+            db.expunge_all()
+            indexes += len(ids)
+            dernier = ids[-1]
+    finally:
+        db.close()
+    return indexes
+
+
+def construire_requete(saisie):
+    """Saisie libre → requête FTS5 : chaque mot devient une phrase exacte (préfixe s'il finit par *)."""
+    termes = []
+    for mot in saisie.split():
+        prefixe = mot.endswith("*")
+        mot = mot.rstrip("*").replace('"', '""')
+        if mot:
+            termes.append(f'"{mot}"' + ("*" if prefixe else ""))
+    return " ".join(termes)
+
+
+def surligner(extrait):
+    if extrait is None:
+        return None
+    return html.escape(extrait).replace(_DEBUT_SURLIGNE, "<mark>").replace(_FIN_SURLIGNE, "</mark>")
+
+
+def _sans_accents(texte):
+    # Un caractère pour un caractère : les positions trouvées valent dans le texte d'origine
+    return "".join(unicodedata.normalize("NFD", c)[0].lower()[0] for c in texte)
+
+
+def _motif(saisie):
+    """Expression des termes saisis, comparée au texte sans accents ni majuscules (comme unicode61)."""
+    termes = []
+    for mot in saisie.split():
+        prefixe = mot.endswith("*")
+        mot = _sans_accents(mot.rstrip("*").replace('"', ""))
+        if mot:
+            termes.append(r"(?<!\w)" + re.escape(mot) + (r"\w*" if prefixe else r"(?!\w)"))
+    return re.compile("|".join(termes)) if termes else None
+
+
+def extrait(textes, motif):
+    """Passage du premier texte qui contient un terme, termes délimités pour surligner() ; None sinon."""
+    for texte in textes:
+        if not texte:
+            continue
+        normalise = _sans_accents(texte)
+        trouve = motif.search(normalise)
+        if trouve is None:
+            continue
+        debut = max(0, trouve.start() - EXTRAIT_CONTEXTE)
+        fin = min(len(texte), debut + EXTRAIT_LONGUEUR)
+        morceaux, position = [], debut
+        for correspondance in motif.finditer(normalise, debut, fin):
+            morceaux += [texte[position:correspondance.start()], _DEBUT_SURLIGNE,
+                         texte[correspondance.start():correspondance.end()], _FIN_SURLIGNE]
+            position = correspondance.end()
+        morceaux.append(texte[position:fin])
+        return ("…" if debut else "") + "".join(morceaux) + ("…" if fin < len(texte) else "")
+    return None
+
+
+def _extraits(db, lignes, saisie):
+    """Extraits des logs de la page : seules ces sorties sont relues et décompressées."""
+    motif = _motif(saisie)
+    if motif is None or not lignes:
+        return {}
+    sorties = dict((i, (o, e)) for i, o, e in db.query(LogExecution.id, LogExecution.stdout, LogExecution.stderr)
+                   .filter(LogExecution.id.in_([ligne.id for ligne in lignes])))
+    return {ligne.id: extrait([ligne.script, *sorties.get(ligne.id, (None, None)), ligne.error], motif)
+            for ligne in lignes}
+
+
+def rechercher(db, saisie, serveur_id=None, debut=None, fin=None, origine=None, avant=None, limite=RECHERCHE_PAR_PAGE):
+    """Logs correspondant à `saisie`, du plus récent au plus ancien ; retourne (résultats, curseur suivant).
+
+    `debut`/`fin` sont des dates (fin incluse), `avant` le curseur (id) de la page précédente.
+    """
+    limite = max(1, min(limite, RECHERCHE_PAR_PAGE_MAX))
+    requete_fts = construire_requete(saisie or "")
+    if not requete_fts:
+        return [], None
+    colonnes = [LogExecution.id, LogExecution.serveur_id, Serveur.nom, LogExecution.date_execution,
+                LogExecution.origine, LogExecution.echec, LogExecution.script, LogExecution.error]
+    if fts_actif:
+        # L'index est parcouru par rowid décroissant : la limite arrête la lecture sans trier tous les résultats
+        requete = select(*colonnes) \
+            .select_from(_fts.join(LogExecution.__table__, LogExecution.id == _fts.c.rowid)
+                         .outerjoin(Serveur.__table__, Serveur.id == LogExecution.serveur_id)) \
+            .where(text("logs_fts MATCH :requete").bindparams(requete=requete_fts)) \
+            .order_by(_fts.c.rowid.desc())
+        identifiant = _fts.c.rowid
+    else:
+        motifs = [f"%{mot.rstrip('*')}%" for mot in saisie.split()]
+        requete = select(*colonnes) \
+            .select_from(LogExecution.__table__.outerjoin(Serveur.__table__, Serveur.id == LogExecution.serveur_id)) \
+            .where(*(or_(LogExecution.script.ilike(m), LogExecution.error.ilike(m)) for m in motifs)) \
+            .order_by(LogExecution.id.desc())
+        identifiant = LogExecution.id
+    if serveur_id:
+        requete = requete.where(LogExecution.serveur_id == serveur_id)
+    if debut:
+        requete = requete.where(LogExecution.date_execution >= datetime.combine(debut, datetime.min.time()))
+    if fin:
+        requete = requete.where(LogExecution.date_execution < datetime.combine(fin + timedelta(days=1), datetime.min.time()))
+    if origine:
+        requete = requete.where(LogExecution.origine == origine)
+    if avant:
+        requete = requete.where(identifiant < avant)
+    lignes = db.execute(requete.limit(limite + 1)).all()
+    suivant = lignes[limite - 1].id if len(lignes) > limite else None
+    lignes = lignes[:limite]
+    extraits = _extraits(db, lignes, saisie)
+    resultats = [
+        {
+            "id": ligne.id,
+            "serveur_id": ligne.serveur_id,
+            "serveur": ligne.nom,
+            "date_execution": ligne.date_execution.isoformat() if ligne.date_execution else None,
+            "origine": ligne.origine,
+            "echec": ligne.echec,
+            "script": ligne.script,
+            "error": ligne.error,
+            "extrait_html": surligner(extraits.get(ligne.id)),
+        }
+        for ligne in lignes
+    ]
+    return resultats, suivant
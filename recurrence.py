@@ -0,0 +1,101 @@
+import os
+import re
+import zlib
+from datetime import timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from apscheduler.triggers.cron import CronTrigger
+
+# --- Récurrence des tâches planifiées : expressions cron, intervalles, gigue, politique de retard ---
+# date_execution (UTC naïf) est la prochaine échéance précalculée, gigue comprise : c'est elle que les
+# workers réclament (index statut + date_execution). L'échéance suivante se calcule depuis le calendrier,
+# jamais depuis la fin de l'exécution : un run en retard ne décale pas les suivants.
+RECURRENCE_FUSEAU = ZoneInfo(os.environ.get("COLLECTEUR_RECURRENCE_FUSEAU", "UTC"))  # fuseau des expressions cron
+RECURRENCE_TOLERANCE = float(os.environ.get("COLLECTEUR_RECURRENCE_TOLERANCE", "60"))  # secondes
+
+# regrouper : une seule exécution pour toutes les échéances manquées ; rattraper : une par échéance manquée ;
+# ignorer : une échéance dépassée de plus de RECURRENCE_TOLERANCE n'est pas exécutée
+POLITIQUES = ("regrouper", "rattraper", "ignorer")
+POLITIQUE_DEFAUT = "regrouper"
+
+_ALIAS = {"hourly": "1h", "daily": "1d", "weekly": "1w"}
+_UNITES = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+_INTERVALLE = re.compile(r"^(\d+)\s*([smhdw])$")
+
+
+class Intervalle:
+    def __init__(self, periode):
+        self.periode = periode
+
+    def suivante(self, ancre, apres):
+        """Première échéance ancre + k × période strictement postérieure à `apres`."""
+        k = (apres - ancre) // self.periode + 1
+        return ancre + max(k, 1) * self.periode
+
+
+class Cron:
+    def __init__(self, expression):
+        self.declencheur = CronTrigger.from_crontab(expression, timezone=RECURRENCE_FUSEAU)
+
+    def suivante(self, ancre, apres):
+        # Échéances à la seconde pleine : la première à partir de `apres` + 1 s est strictement postérieure
+        depuis = (apres.replace(microsecond=0) + timedelta(seconds=1)).replace(tzinfo=timezone.utc)
+        suivante = self.declencheur.get_next_fire_time(None, depuis)
+        if suivante is None:
+            return None
+        return suivante.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def analyser(texte):
+    """'none' ou vide : aucune ; 'daily', 'weekly', '15m', '2h', '1d'… : intervalle ; 5 champs : cron.
+
+    Lève ValueError si le texte n'est pas reconnu.
+    """
+    texte = (texte or "").strip()
+    if texte.lower() in ("", "none"):
+        return None
+    texte = _ALIAS.get(texte.lower(), texte)
+    correspondance = _INTERVALLE.match(texte.lower())
+    if correspondance:
+        periode = int(correspondance.group(1)) * _UNITES[correspondance.group(2)]
+        if periode <= 0:
+            raise ValueError("L'intervalle doit être positif")
+        return Intervalle(timedelta(seconds=periode))
+    if len(texte.split()) == 5:
+        try:
+            return Cron(texte)
+        except ValueError as e:
+            raise ValueError(f"Expression cron invalide : {e}")
+    raise ValueError(f"Récurrence non reconnue : {texte!r} (ex. '*/15 * * * *', '30m', 'daily')")
+
+
+def decalage(tache_id, gigue, serveur_id=None):
+    """Décalage stable dans [0, gigue] secondes : des tâches de même calendrier s'étalent.
+
+    Avec `serveur_id`, décalage propre à un serveur d'une tâche de groupe (ses membres s'étalent aussi).
+    """
+    if not gigue:
+        return timedelta(0)
+    cle = str(tache_id) if serveur_id is None else f"{tache_id}:{serveur_id}"
+    return timedelta(seconds=zlib.crc32(cle.encode()) % (int(gigue) + 1))
+
+
+def doit_executer(tache, maintenant):
+    """False si l'échéance est manquée et que la politique de la tâche est de l'ignorer."""
+    retard = (maintenant - tache.date_execution).total_seconds()
+    return not (tache.politique_retard == "ignorer" and retard > RECURRENCE_TOLERANCE)
+
+
+def prochaine_echeance(tache, maintenant):
+    """date_execution suivante après l'occurrence en cours (exécutée ou ignorée), None si la tâche est terminée."""
+    regle = analyser(tache.recurrence)
+    if regle is None:
+        return None
+    ecart = decalage(tache.id, tache.gigue)
+    nominale = tache.date_execution - ecart
+    if tache.politique_retard == "rattraper":
+        suivante = regle.suivante(nominale, nominale)
+    else:
+        # Les échéances déjà passées sont sautées : on reprend le calendrier à partir de maintenant
+        suivante = regle.suivante(nominale, max(nominale, maintenant - ecart))
+    return suivante + ecart if suivante is not None else None
@@ -0,0 +1,96 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import undefer
+
+from database import SessionLocal, engine
+from models import LogExecution
+from recherche import desindexer
+
+# --- Politique de rétention des logs d'exécution ---
+RETENTION_JOURS = int(os.environ.get("COLLECTEUR_RETENTION_JOURS", "90"))  # 0 = pas de limite d'âge
+RETENTION_MAX_PAR_SERVEUR = int(os.environ.get("COLLECTEUR_RETENTION_MAX_PAR_SERVEUR", "10000"))  # 0 = illimité
+RETENTION_LOT = int(os.environ.get("COLLECTEUR_RETENTION_LOT", "1000"))
+RETENTION_ARCHIVE = os.environ.get("COLLECTEUR_RETENTION_ARCHIVE")  # dossier d'archives .jsonl.gz (optionnel)
+RETENTION_PAGES_VACUUM = int(os.environ.get("COLLECTEUR_RETENTION_PAGES_VACUUM", "2000"))
+
+
+def _archiver(db, ids):
+    # Sorties chargées avec les lignes (colonnes différées : sinon deux SELECT par log)
+    logs = db.query(LogExecution).options(undefer(LogExecution.stdout), undefer(LogExecution.stderr)) \
+        .filter(LogExecution.id.in_(ids)).all()
+    os.makedirs(RETENTION_ARCHIVE, exist_ok=True)
+    chemin = os.path.join(RETENTION_ARCHIVE, f"logs-{datetime.utcnow():%Y%m%d}.jsonl.gz")
+    with gzip.open(chemin, "at", encoding="utf-8") as f:
+        for log in logs:
+            f.write(json.dumps({
+                "id": log.id,
+                "serveur_id": log.serveur_id,
+                "date_execution": log.date_execution.isoformat() if log.date_execution else None,
+                "script": log.script,
+                "stdout": log.stdout,
+                "stderr": log.stderr,
+                "error": log.error,
+            }) + "\n")
+
+
+def _supprimer_lot(db, ids):
+    if RETENTION_ARCHIVE:
+        _archiver(db, ids)
+    desindexer(db, ids)
+    db.query(LogExecution).filter(LogExecution.id.in_(ids)).delete(synchronize_session=False)
+    db.commit()
+    return len(ids)
+
+
+def _recuperer_espace():
+    """Rend au système les pages libérées, par petits pas (SQLite en auto_vacuum incrémental)."""
+    if engine.dialect.name != "sqlite":
+        return
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            pages = min(cursor.execute("PRAGMA freelist_count").fetchone()[0], RETENTION_PAGES_VACUUM)
+            # Le module sqlite3 n'exécute qu'une étape du pragma, soit une page libérée par appel
+            cursor.execute("BEGIN")
+            for _ in range(pages):
+                cursor.execute("PRAGMA incremental_vacuum(1)")
+        cursor.close()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def purger_logs():
+    """Supprime (ou archive puis supprime) les logs trop anciens ou en surnombre, par lots."""
+    db = SessionLocal()
+    supprimes = 0
+    try:
+        if RETENTION_JOURS > 0:
+            limite = datetime.utcnow() - timedelta(days=RETENTION_JOURS)
+            while True:
+                ids = [i for (i,) in db.query(LogExecution.id).filter(LogExecution.date_execution < limite).limit(RETENTION_LOT)]
+                if not ids:
+                    break
+                supprimes += _supprimer_lot(db, ids)
+        if RETENTION_MAX_PAR_SERVEUR > 0:
+            en_surnombre = db.query(LogExecution.serveur_id).group_by(LogExecution.serveur_id).having(
+                func.count(LogExecution.id) > RETENTION_MAX_PAR_SERVEUR).all()
+            for (serveur_id,) in en_surnombre:
+                while True:
+                    ids = [i for (i,) in db.query(LogExecution.id)
+                           .filter(LogExecution.serveur_id == serveur_id)
+                           .order_by(LogExecution.date_execution.desc(), LogExecution.id.desc())
+                           .offset(RETENTION_MAX_PAR_SERVEUR).limit(RETENTION_LOT)]
+                    if not ids:
+                        break
+                    supprimes += _supprimer_lot(db, ids)
+    finally:
+        db.close()
+    if supprimes:
+        _recuperer_espace()
+    return supprimes
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from database import SessionLocal
+from models import Serveur
+
+# --- Santé de la flotte : sondes TCP parallèles vers le port SSH, résultats en cache ---
+SANTE_CONCURRENCE = int(os.environ.get("COLLECTEUR_SANTE_CONCURRENCE", "100"))
+SANTE_TIMEOUT = float(os.environ.get("COLLECTEUR_SANTE_TIMEOUT", "2"))
+SANTE_TTL = float(os.environ.get("COLLECTEUR_SANTE_TTL", "30"))
+SANTE_INTERVALLE = float(os.environ.get("COLLECTEUR_SANTE_INTERVALLE", "20"))  # rafraîchissement de fond, < TTL
+SANTE_HISTORIQUE = int(os.environ.get("COLLECTEUR_SANTE_HISTORIQUE", "20"))
+
+
+async def _sonder(adresse, port, semaphore):
+    async with semaphore:
+        debut = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(adresse, port), SANTE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False, None, f"Timeout après {SANTE_TIMEOUT:g} s"
+        except OSError as e:
+            return False, None, e.strerror or str(e)
+        latence = round((time.perf_counter() - debut) * 1000, 1)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True, latence, None
+
+
+async def _sonder_tous(cibles):
+    semaphore = asyncio.Semaphore(SANTE_CONCURRENCE)
+    return await asyncio.gather(*(_sonder(adresse, port, semaphore) for _, adresse, port in cibles))
+
+
+class CacheSante:
+    def __init__(self, ttl=SANTE_TTL):
+        self.ttl = ttl
+        self._etats = {}
+        self._verifie_a = None
+        self._horloge = 0.0
+        self._lock = threading.Lock()
+        self._rafraichissement = threading.Lock()
+
+    def rafraichir(self):
+        """Sonde tous les serveurs en une passe ; un seul rafraîchissement à la fois."""
+        if not self._rafraichissement.acquire(blocking=False):
+            # Un autre thread sonde déjà : on attend son résultat
+            with self._rafraichissement:
+                return
+        try:
+            db = SessionLocal()
+            try:
+                cibles = db.query(Serveur.id, Serveur.adresse_ip, Serveur.port_ssh).all()
+            finally:
+                db.close()
+            resultats = asyncio.run(_sonder_tous(cibles)) if cibles else []
+            maintenant = datetime.utcnow().isoformat(timespec="seconds")
+            with self._lock:
+                etats = {}
+                for (serveur_id, adresse, port), (joignable, latence, erreur) in zip(cibles, resultats):
+                    precedent = self._etats.get(serveur_id)
+                    historique = precedent["historique"] if precedent else deque(maxlen=SANTE_HISTORIQUE)
+                    historique.append(latence)
+                    etats[serveur_id] = {
+                        "joignable": joignable,
+                        "latence_ms": latence,
+                        "erreur": erreur,
+                        "adresse": adresse,
+                        "port": port,
+                        "verifie_a": maintenant,
+                        "historique": historique,
+                    }
+                self._etats = etats
+                self._verifie_a = maintenant
+                self._horloge = time.monotonic()
+        finally:
+            self._rafraichissement.release()
+
+    def etat(self):
+        if time.monotonic() - self._horloge > self.ttl:
+            self.rafraichir()
+        with self._lock:
+            return {
+                "verifie_a": self._verifie_a,
+                "serveurs": {
+                    serveur_id: dict(e, historique=list(e["historique"]))
+                    for serveur_id, e in self._etats.items()
+                },
+            }
+
+
+cache_sante = CacheSante()
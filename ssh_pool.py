@@ -0,0 +1,339 @@
+import codecs
+import os
+import select
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# --- Configuration du pool SSH (surchargeable par variables d'environnement) ---
+SSH_MAX_PAR_HOTE = int(os.environ.get("COLLECTEUR_SSH_MAX_PAR_HOTE", "4"))
+SSH_INACTIVITE_MAX = float(os.environ.get("COLLECTEUR_SSH_INACTIVITE_MAX", "300"))
+SSH_KEEPALIVE = int(os.environ.get("COLLECTEUR_SSH_KEEPALIVE", "30"))
+SSH_ATTENTE_MAX = float(os.environ.get("COLLECTEUR_SSH_ATTENTE_MAX", "30"))
+SSH_TIMEOUT_CONNEXION = float(os.environ.get("COLLECTEUR_SSH_TIMEOUT_CONNEXION", "10"))
+
+
+_paramiko = None
+
+
+def _module_paramiko():
+    """paramiko (et cryptography) n'est importé qu'à la première connexion : démarrage plus rapide."""
+    global _paramiko
+    if _paramiko is None:
+        import paramiko
+        _paramiko = paramiko
+    return _paramiko
+
+
+class PoolSatureError(Exception):
+    """Aucune connexion disponible pour l'hôte dans le délai imparti."""
+
+
+class ExecutionAnnuleeError(Exception):
+    """L'exécution a été annulée (timeout ou abandon par l'appelant)."""
+
+
+class Annulation:
+    """Permet d'interrompre depuis un autre thread une commande bloquée sur son canal SSH."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._canal = None
+        self.annulee = False
+
+    def attacher(self, canal):
+        with self._lock:
+            self._canal = canal
+            if self.annulee:
+                canal.close()
+
+    def annuler(self):
+        with self._lock:
+            self.annulee = True
+            if self._canal is not None:
+                self._canal.close()
+
+    def verifier(self):
+        if self.annulee:
+            raise ExecutionAnnuleeError("Exécution annulée")
+
+
+def parametres_connexion(serveur):
+    """Extrait les paramètres de connexion d'un Serveur (détachés de la session DB)."""
+    params = {
+        "hostname": serveur.adresse_ip,
+        "port": serveur.port_ssh,
+        "username": serveur.utilisateur_ssh,
+    }
+    if serveur.chemin_cle_privee:
+        params["key_filename"] = serveur.chemin_cle_privee
+    elif serveur.mot_de_passe:
+        params["password"] = serveur.mot_de_passe
+    return params
+
+
+class _Hote:
+    def __init__(self, params):
+        self.params = params
+        self.libres = []  # [(client, dernier_usage)]
+        self.en_cours = 0  # connexions empruntées ou en cours d'ouverture
+
+    def total(self):
+        return self.en_cours + len(self.libres)
+
+
+class PoolSSH:
+    """Pool de connexions SSH réutilisables, indexé par serveur (id + adresse + identifiants)."""
+
+    def __init__(self, max_par_hote=SSH_MAX_PAR_HOTE, inactivite_max=SSH_INACTIVITE_MAX,
+                 keepalive=SSH_KEEPALIVE, attente_max=SSH_ATTENTE_MAX):
+        self.max_par_hote = max_par_hote
+        self.inactivite_max = inactivite_max
+        self.keepalive = keepalive
+        self.attente_max = attente_max
+        self._cond = threading.Condition()
+        self._hotes = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "reconnexions": 0,
+            "evictions": 0,
+            "handshakes": 0,
+            "handshake_total_s": 0.0,
+            "handshake_max_s": 0.0,
+        }
+
+    @staticmethod
+    def _cle(serveur_id, params):
+        return (serveur_id, params["hostname"], params["port"], params["username"],
+                params.get("key_filename"), params.get("password"))
+
+    @staticmethod
+    def _actif(client):
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def _connecter(self, params, chemin):
+        paramiko = _module_paramiko()
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        debut = time.perf_counter()
+        with metrics.ssh_handshake.chrono(chemin=chemin):
+            client.connect(timeout=SSH_TIMEOUT_CONNEXION, **params)
+        duree = time.perf_counter() - debut
+        client.get_transport().set_keepalive(self.keepalive)
+        with self._cond:
+            self._stats["handshakes"] += 1
+            self._stats["handshake_total_s"] += duree
+            self._stats["handshake_max_s"] = max(self._stats["handshake_max_s"], duree)
+        return client
+
+    def _emprunter(self, cle, params, chemin):
+        limite = time.monotonic() + self.attente_max
+        fermer = []
+        try:
+            with self._cond:
+                hote = self._hotes.get(cle)
+                if hote is None:
+                    hote = self._hotes[cle] = _Hote(params)
+                while True:
+                    client = None
+                    while hote.libres:
+                        candidat, _ = hote.libres.pop()
+                        if self._actif(candidat):
+                            client = candidat
+                            break
+                        fermer.append(candidat)
+                        self._stats["reconnexions"] += 1
+                    if client is not None:
+                        hote.en_cours += 1
+                        self._stats["hits"] += 1
+                        break
+                    if hote.total() < self.max_par_hote:
+                        hote.en_cours += 1
+                        self._stats["misses"] += 1
+                        break
+                    restant = limite - time.monotonic()
+                    if restant <= 0:
+                        raise PoolSatureError(f"Trop de connexions SSH ouvertes vers {params['hostname']}")
+                    self._cond.wait(restant)
+        finally:
+            for c in fermer:
+                c.close()
+        if client is not None:
+            return client, True
+        try:
+            return self._connecter(params, chemin), False
+        except Exception:
+            self._liberer(cle, None)
+            raise
+
+    def _liberer(self, cle, client):
+        with self._cond:
+            hote = self._hotes.get(cle)
+            if hote is not None:
+                hote.en_cours -= 1
+                if client is not None and self._actif(client):
+                    hote.libres.append((client, time.monotonic()))
+                    client = None
+            self._cond.notify_all()
+        if client is not None:
+            client.close()
+
+    @contextmanager
+    def client(self, serveur, chemin="api"):
+        """Emprunte un SSHClient connecté pour `serveur` et le rend au pool en sortie."""
+        params = parametres_connexion(serveur)
+        cle = self._cle(serveur.id, params)
+        client, _ = self._emprunter(cle, params, chemin)
+        try:
+            yield client
+        finally:
+            self._liberer(cle, client)
+
+    def executer(self, serveur, script, timeout=None, annulation=None, chemin="api"):
+        """Exécute `script` sur `serveur` via une connexion du pool, retourne (stdout, stderr).
+
+        Si la connexion réutilisée est tombée entre-temps, une nouvelle est ouverte une fois.
+        `annulation` (optionnelle) permet d'interrompre la commande depuis un autre thread ;
+        `chemin` ("api", "flux", "planificateur") étiquette les métriques.
+        """
+        paramiko = _module_paramiko()
+        annulation = annulation or Annulation()
+        params = parametres_connexion(serveur)
+        cle = self._cle(serveur.id, params)
+        for tentative in range(2):
+            annulation.verifier()
+            client, reutilise = self._emprunter(cle, params, chemin)
+            try:
+                with metrics.ssh_execution.chrono(chemin=chemin):
+                    stdin, stdout, stderr = client.exec_command(script, timeout=timeout)
+                    annulation.attacher(stdout.channel)
+                    try:
+                        sortie = stdout.read().decode()
+                        erreur = stderr.read().decode()
+                    finally:
+                        stdout.channel.close()
+                annulation.verifier()
+                return sortie, erreur
+            except (paramiko.SSHException, EOFError, ConnectionError):
+                # Seule une connexion réutilisée dont le transport est tombé est retentée
+                if self._actif(client) or not reutilise or tentative:
+                    raise
+                with self._cond:
+                    self._stats["reconnexions"] += 1
+            finally:
+                self._liberer(cle, client)
+
+    def flux(self, serveur, script, timeout=None, taille_bloc=32768, annulation=None):
+        """Exécute `script` et produit les sorties au fil de l'eau.
+
+        Génère des tuples ("stdout" | "stderr", texte) à mesure que les blocs arrivent,
+        puis ("exit", code_retour). Le canal est fermé si le consommateur s'arrête avant la fin.
+        """
+        paramiko = _module_paramiko()
+        annulation = annulation or Annulation()
+        limite = time.monotonic() + timeout if timeout else None
+        decodeurs = {
+            "stdout": codecs.getincrementaldecoder("utf-8")("replace"),
+            "stderr": codecs.getincrementaldecoder("utf-8")("replace"),
+        }
+        with self.client(serveur, chemin="flux") as client:
+            debut = time.perf_counter()
+            statut = "erreur"
+            canal = client.get_transport().open_session(timeout=timeout)
+            try:
+                annulation.attacher(canal)
+                canal.exec_command(script)
+                while True:
+                    lu = False
+                    if canal.recv_ready():
+                        yield "stdout", decodeurs["stdout"].decode(canal.recv(taille_bloc))
+                        lu = True
+                    if canal.recv_stderr_ready():
+                        yield "stderr", decodeurs["stderr"].decode(canal.recv_stderr(taille_bloc))
+                        lu = True
+                    if lu:
+                        continue
+                    if canal.exit_status_ready():
+                        break
+                    if canal.closed:
+                        annulation.verifier()
+                        raise paramiko.SSHException("Canal fermé avant la fin de la commande")
+                    if limite is not None and time.monotonic() > limite:
+                        raise TimeoutError(f"Timeout après {timeout:g} s")
+                    # Réveil immédiat sur stdout, scrutation courte pour stderr
+                    select.select([canal], [], [], 0.1)
+                for nom, decodeur in decodeurs.items():
+                    reste = decodeur.decode(b"", final=True)
+                    if reste:
+                        yield nom, reste
+                statut = "ok"
+                yield "exit", canal.recv_exit_status()
+            finally:
+                canal.close()
+                metrics.ssh_execution.observer(time.perf_counter() - debut, chemin="flux", statut=statut)
+
+    def fermer_hote(self, serveur_id):
+        """Ferme les connexions inactives d'un serveur (après édition ou suppression)."""
+        fermer = []
+        with self._cond:
+            for cle, hote in list(self._hotes.items()):
+                if cle[0] == serveur_id:
+                    fermer.extend(c for c, _ in hote.libres)
+                    hote.libres = []
+                    if hote.en_cours == 0:
+                        del self._hotes[cle]
+        for c in fermer:
+            c.close()
+
+    def evincer_inactifs(self):
+        """Ferme les connexions restées inutilisées plus de `inactivite_max` secondes."""
+        seuil = time.monotonic() - self.inactivite_max
+        fermer = []
+        with self._cond:
+            for cle, hote in list(self._hotes.items()):
+                garder = []
+                for client, dernier_usage in hote.libres:
+                    if dernier_usage < seuil or not self._actif(client):
+                        fermer.append(client)
+                    else:
+                        garder.append((client, dernier_usage))
+                hote.libres = garder
+                if hote.total() == 0:
+                    del self._hotes[cle]
+            self._stats["evictions"] += len(fermer)
+        for c in fermer:
+            c.close()
+
+    def fermer(self):
+        with self._cond:
+            fermer = [c for hote in self._hotes.values() for c, _ in hote.libres]
+            self._hotes = {}
+        for c in fermer:
+            c.close()
+
+    def statistiques(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["hotes"] = len(self._hotes)
+            stats["connexions_libres"] = sum(len(h.libres) for h in self._hotes.values())
+            stats["connexions_en_cours"] = sum(h.en_cours for h in self._hotes.values())
+        stats["handshake_moyen_s"] = stats["handshake_total_s"] / stats["handshakes"] if stats["handshakes"] else 0.0
+        return stats
+
+
+pool_ssh = PoolSSH()
+
+metrics.Compteur("collecteur_ssh_pool_hits_total", "Connexions SSH réutilisées depuis le pool",
+                 fonction=lambda: pool_ssh.statistiques()["hits"])
+metrics.Compteur("collecteur_ssh_pool_misses_total", "Connexions SSH ouvertes faute de connexion libre",
+                 fonction=lambda: pool_ssh.statistiques()["misses"])
+metrics.Compteur("collecteur_ssh_pool_reconnexions_total", "Connexions SSH retrouvées mortes et remplacées",
+                 fonction=lambda: pool_ssh.statistiques()["reconnexions"])
+metrics.Jauge("collecteur_ssh_pool_connexions_libres", "Connexions SSH ouvertes et disponibles",
+              fonction=lambda: pool_ssh.statistiques()["connexions_libres"])
+metrics.Jauge("collecteur_ssh_pool_connexions_en_cours", "Connexions SSH empruntées ou en cours d'ouverture",
+              fonction=lambda: pool_ssh.statistiques()["connexions_en_cours"])
@@ -0,0 +1,27 @@
+// File d'admission des exécutions SSH : exécutions en cours et en attente, rafraîchie toutes les 2 s
+function rafraichirFileExecution() {
+    fetch('/execution/file')
+        .then(r => r.json())
+        .then(data => {
+            document.getElementById('file-exec-resume').textContent =
+                `${data.en_cours} en cours (max ${data.max_global}, ${data.max_par_hote} par serveur) — ${data.en_attente} en attente`;
+            const corps = document.getElementById('file-exec-corps');
+            corps.innerHTML = '';
+            data.file.forEach(e => {
+                const ligne = document.createElement('tr');
+                [e.position, e.nom, e.origine, e.priorite, `${Math.round(e.attente_s)} s`].forEach(valeur => {
+                    const cellule = document.createElement('td');
+                    cellule.textContent = valeur;
+                    ligne.appendChild(cellule);
+                });
+                corps.appendChild(ligne);
+            });
+            document.getElementById('file-exec-table').style.display = data.file.length ? '' : 'none';
+        })
+        .catch(() => {});
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    rafraichirFileExecution();
+    setInterval(rafraichirFileExecution, 2000);
+});
@@ -0,0 +1,32 @@
+// Les sorties ne sont chargées (et décompressées côté serveur) qu'à l'ouverture de la ligne
+function chargerSortie(details, logId) {
+    if (!details.open || details.dataset.charge) {
+        return;
+    }
+    details.dataset.charge = '1';
+    const conteneur = details.querySelector('.sortie-log');
+    fetch(`/logs/${logId}/sortie`, { headers: { 'Accept': 'application/json' } })
+        .then(r => r.json())
+        .then(data => {
+            conteneur.innerHTML = '';
+            const blocs = [['Sortie standard', data.stdout, ''], ["Sortie d'erreur", data.stderr, 'sortie-stderr']];
+            for (const [titre, texte, classe] of blocs) {
+                if (!texte) {
+                    continue;
+                }
+                const b = document.createElement('b');
+                b.textContent = titre + ' :';
+                const pre = document.createElement('pre');
+                pre.className = classe;
+                pre.textContent = texte;
+                conteneur.append(b, pre);
+            }
+            if (!conteneur.childElementCount) {
+                conteneur.innerHTML = "<span style='color:#888;'>(aucune sortie)</span>";
+            }
+        })
+        .catch(() => {
+            delete details.dataset.charge;
+            conteneur.innerHTML = "<span style='color:red;'>Erreur réseau</span>";
+        });
+}
@@ -0,0 +1,31 @@
+// Badges d'état de tous les serveurs en une seule requête (résultats en cache côté serveur)
+function rafraichirBadgesSante() {
+    fetch('/sante')
+        .then(r => r.json())
+        .then(data => {
+            document.querySelectorAll('.badge-sante').forEach(badge => {
+                const etat = data.serveurs[badge.dataset.serveurId];
+                badge.classList.remove('badge-sante-ok', 'badge-sante-ko');
+                if (!etat) {
+                    badge.textContent = '…';
+                    badge.title = '';
+                    return;
+                }
+                if (etat.joignable) {
+                    badge.classList.add('badge-sante-ok');
+                    badge.textContent = `OK ${etat.latence_ms} ms`;
+                } else {
+                    badge.classList.add('badge-sante-ko');
+                    badge.textContent = 'Injoignable';
+                }
+                const historique = etat.historique.map(l => l === null ? '✗' : l).join(' ');
+                badge.title = `${etat.adresse}:${etat.port} — vérifié à ${etat.verifie_a} UTC\n${etat.erreur || ''}\nLatences (ms) : ${historique}`;
+            });
+        })
+        .catch(() => {});
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    rafraichirBadgesSante();
+    setInterval(rafraichirBadgesSante, 30000);
+});
@@ -0,0 +1,86 @@
+let sourceDirect = null;
+
+function executerEnDirect(form, serveurNom) {
+    const serveurId = form.querySelector('input[name="serveur_id"]').value;
+    const script = form.querySelector('input[name="script"]').value;
+    if (!script) {
+        form.reportValidity();
+        return;
+    }
+    if (sourceDirect) {
+        sourceDirect.close();
+    }
+    const panneau = document.getElementById('resultat-direct');
+    const sortie = document.getElementById('resultat-direct-sortie');
+    const statut = document.getElementById('resultat-direct-statut');
+    document.getElementById('resultat-direct-titre').textContent = `Exécution en direct sur ${serveurNom}`;
+    sortie.textContent = '';
+    statut.innerHTML = "<span style='color:#888;'>En cours...</span>";
+    panneau.style.display = 'block';
+    panneau.scrollIntoView({ behavior: 'smooth' });
+
+    // Le script part dans un POST ; le flux ne porte que l'identifiant de l'exécution (à usage unique)
+    fetch(`/serveurs/${serveurId}/executions_directes`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ script: script })
+    }).then(function(reponse) {
+        return reponse.json().then(function(donnees) {
+            if (!reponse.ok) {
+                throw new Error(donnees.detail || `HTTP ${reponse.status}`);
+            }
+            suivreExecution(donnees.flux, statut, sortie);
+        });
+    }).catch(function(erreur) {
+        afficherStatut(statut, 'red', `Exécution refusée : ${erreur.message}`);
+    });
+}
+
+function afficherStatut(statut, couleur, texte) {
+    const element = document.createElement('span');
+    element.style.color = couleur;
+    element.textContent = texte;
+    statut.replaceChildren(element);
+}
+
+function suivreExecution(url, statut, sortie) {
+    sourceDirect = new EventSource(url);
+    sourceDirect.onmessage = function(event) {
+        const bloc = JSON.parse(event.data);
+        const ligne = document.createElement('span');
+        ligne.className = bloc.flux === 'stderr' ? 'sortie-stderr' : 'sortie-stdout';
+        ligne.title = bloc.t;
+        ligne.textContent = bloc.data;
+        const enBas = sortie.scrollTop + sortie.clientHeight >= sortie.scrollHeight - 5;
+        sortie.appendChild(ligne);
+        if (enBas) {
+            sortie.scrollTop = sortie.scrollHeight;
+        }
+    };
+    sourceDirect.addEventListener('file', function(event) {
+        // Limite de sessions atteinte sur l'hôte ou globalement : l'exécution attend son tour
+        const file = JSON.parse(event.data);
+        afficherStatut(statut, '#888', `En file d'attente : position ${file.position}, depuis ${Math.round(file.attente_s)} s`);
+    });
+    sourceDirect.addEventListener('fin', function(event) {
+        const fin = JSON.parse(event.data);
+        if (fin.error) {
+            afficherStatut(statut, 'red', `Erreur : ${fin.error}`);
+        } else {
+            afficherStatut(statut, fin.code_retour === 0 ? 'green' : 'red', `Terminé (code retour ${fin.code_retour})`);
+        }
+        sourceDirect.close();
+        sourceDirect = null;
+    });
+    sourceDirect.addEventListener('message', function() {
+        statut.innerHTML = "<span style='color:#888;'>En cours...</span>";
+    }, { once: true });
+    sourceDirect.onerror = function() {
+        // L'identifiant n'est valable qu'une fois : une reconnexion d'EventSource échouerait
+        if (sourceDirect) {
+            statut.innerHTML = "<span style='color:red;'>Connexion interrompue ou exécution refusée (capacité atteinte)</span>";
+            sourceDirect.close();
+            sourceDirect = null;
+        }
+    };
+}
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import zlib
+
+# --- Stockage borné et compressé des sorties d'exécution ---
+LOG_SORTIE_MAX = int(os.environ.get("COLLECTEUR_LOG_SORTIE_MAX", str(1024 * 1024)))  # caractères conservés par sortie
+LOG_SEUIL_COMPRESSION = int(os.environ.get("COLLECTEUR_LOG_SEUIL_COMPRESSION", "512"))
+
+# Préfixes du format stocké ; une valeur str (sans préfixe) est une ligne antérieure non compressée
+_BRUT = b"t:"
+_ZLIB = b"z:"
+
+
+def marqueur_troncature(nb):
+    return f"\n[... {nb} caractères tronqués ...]\n"
+
+
+def tronquer(texte, maximum=LOG_SORTIE_MAX):
+    """Conserve le début et la fin de `texte` si sa taille dépasse `maximum`."""
+    if texte is None or maximum <= 0 or len(texte) <= maximum:
+        return texte
+    moitie = maximum // 2
+    return texte[:moitie] + marqueur_troncature(len(texte) - 2 * moitie) + texte[-moitie:]
+
+
+def empreinte(stdout, stderr, error):
+    """Empreinte du résultat d'une exécution (sorties et erreur) : deux résultats identiques ont la même."""
+    h = hashlib.blake2b(digest_size=8)
+    for partie in (stdout, stderr, error):
+        # Longueur en préfixe : ("ab", "c") et ("a", "bc") ne se confondent pas ; None ≠ ""
+        donnees = b"" if partie is None else partie.encode("utf-8", "replace")
+        h.update(b"-" if partie is None else str(len(donnees)).encode() + b":")
+        h.update(donnees)
+    return h.hexdigest()
+
+
+def compresser(texte):
+    donnees = texte.encode("utf-8")
+    if len(donnees) < LOG_SEUIL_COMPRESSION:
+        return _BRUT + donnees
+    return _ZLIB + zlib.compress(donnees, 6)
+
+
+def decompresser(valeur):
+    if isinstance(valeur, str):
+        return valeur
+    valeur = bytes(valeur)
+    if valeur.startswith(_ZLIB):
+        return zlib.decompress(valeur[len(_ZLIB):]).decode("utf-8", "replace")
+    if valeur.startswith(_BRUT):
+        return valeur[len(_BRUT):].decode("utf-8", "replace")
+    return valeur.decode("utf-8", "replace")
+
+
+class SortieBornee:
+    """Accumule une sortie streamée en ne gardant que le début et la fin (mémoire bornée)."""
+
+    def __init__(self, maximum=LOG_SORTIE_MAX):
+        self.maximum = maximum
+        self.debut = []
+        self.taille_debut = 0
+        self.fin = []
+        self.taille_fin = 0
+        self.total = 0
+
+    def ajouter(self, texte):
+        self.total += len(texte)
+        moitie = self.maximum // 2
+        if self.maximum <= 0:
+            self.debut.append(texte)
+            self.taille_debut += len(texte)
+            return
+        if self.taille_debut < moitie:
+            place = moitie - self.taille_debut
+            self.debut.append(texte[:place])
+            self.taille_debut += len(texte[:place])
+            texte = texte[place:]
+        if texte:
+            self.fin.append(texte)
+            self.taille_fin += len(texte)
+            # Élague les blocs de fin devenus inutiles
+            while self.fin and self.taille_fin - len(self.fin[0]) >= self.maximum - moitie:
+                self.taille_fin -= len(self.fin.pop(0))
+
+    def texte(self):
+        if self.maximum <= 0 or self.total <= self.maximum:
+            return "".join(self.debut) + "".join(self.fin)
+        fin = "".join(self.fin)[-(self.maximum // 2):]
+        return "".join(self.debut) + marqueur_troncature(self.total - self.taille_debut - len(fin)) + fin
@@ -0,0 +1,54 @@
+"""Worker d'exécution des tâches planifiées, séparé de l'application web.
+
+Usage :
+    COLLECTEUR_MODE=web uvicorn main:app --host 0.0.0.0 --port 8000
+    python worker.py        # autant de processus ou de conteneurs que nécessaire, sur la même base
+
+Chaque worker réclame les tâches échues avec un bail en base (voir planificateur.py) :
+une occurrence n'est exécutée que par un seul worker, et reprise si celui-ci s'arrête en pleine exécution.
+"""
+import logging
+import signal
+import sys
+import threading
+import time
+
+from apscheduler.triggers.interval import IntervalTrigger
+
+from database import init_db
+from ecrivain_logs import ecrivain_logs
+from planificateur import scheduler, travailleur, demarrer, arreter
+from recherche import initialiser as initialiser_recherche, indexer_manquants
+from retention import purger_logs
+from ssh_pool import pool_ssh
+
+logger = logging.getLogger("collecteur.worker")
+
+
+def main():
+    debut = time.perf_counter()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s : %(message)s")
+    logging.getLogger("paramiko").setLevel(logging.WARNING)
+    init_db()
+    initialiser_recherche()
+    # Maintenance assurée par les workers quand l'application web tourne en mode web
+    scheduler.add_job(pool_ssh.evincer_inactifs, IntervalTrigger(minutes=1), id="evincer_ssh", replace_existing=True)
+    scheduler.add_job(purger_logs, IntervalTrigger(hours=1), id="purge_logs", replace_existing=True)
+    scheduler.add_job(indexer_manquants, id="indexation", replace_existing=True)
+    demarrer()
+    logger.info("Worker %s démarré en %.2f s (%d tâches simultanées)", travailleur.identifiant,
+                time.perf_counter() - debut, travailleur.capacite)
+
+    arret = threading.Event()
+    for signal_arret in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_arret, lambda *_: arret.set())
+    while not arret.wait(1):
+        pass
+    logger.info("Arrêt du worker %s : fin des tâches en cours", travailleur.identifiant)
+    arreter()
+    ecrivain_logs.arreter()
+    pool_ssh.fermer()
+
+
+if __name__ == "__main__":
+    sys.exit(main())